@@ -1,5 +1,6 @@
 # /root/ai_character/character/__init__.py
 # 角色模块包初始化
-from .character import Character
+from .character import Character, get_character
+from .ooc_guard import OOCGuard
 
-__all__ = ["Character"]
\ No newline at end of file
+__all__ = ["Character", "get_character", "OOCGuard"]
\ No newline at end of file
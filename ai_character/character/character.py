@@ -1,21 +1,34 @@
 # /root/ai_character/character/character.py
-from memory.memory_manager import MemoryManager
+from memory.memory_manager import get_memory_manager
+from utils.inference_worker import infer, stream_infer, batch_infer
+from memory.memory_context import build_memory_context
+from emotion.emotion_lexicon import EmotionLexicon
+from .ooc_guard import OOCGuard
 from config import (
     TEXT_CHAT_MODEL_PATH, EMOTION_VALUE_INIT, EMOTION_VALUE_THRESHOLD,
-    ACTIVE_TOPIC_TRIGGER_COUNT
+    ACTIVE_TOPIC_TRIGGER_COUNT, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM, EMOTION_FAST_PATH_ENABLED,
+    OOC_FAST_CHECK_ENABLED, REPLY_CANDIDATE_COUNT, REPLY_CANDIDATE_TEMPERATURE
 )
 import json
 import os
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # 状态保存路径（固定）
 STATE_FILE_PATH = "/root/ai_character/state/furenna_state.json"
+# 额外候选回复的表达要求（依次轮换），避免确定性解码下所有候选完全相同
+CANDIDATE_VARIATION_HINTS = [
+    "换一种说法回复，意思不变",
+    "回复得更简短一些",
+    "从芙宁娜自己的喜好或近况自然地接话",
+]
 
 class Character:
     """芙宁娜核心类：无暂停+自动状态保存+适配旅行者人设"""
     def __init__(self, character_id="furenna"):
         self.character_id = character_id
-        self.memory_manager = MemoryManager(character_id)
+        self.memory_manager = get_memory_manager(character_id)
         
         # ========== 芙宁娜核心人设（最终版） ==========
         self.base_personality = """
@@ -29,6 +42,8 @@ class Character:
         6. 禁忌：不提「水神」「审判」「500年」等神明时期话题。
         """
         self.ooc_threshold = 0.75  # OOC判断阈值
+        # OOC本地预检（禁忌词直接判定，干净回复按抽样率交给模型复查）
+        self.ooc_guard = OOCGuard(self.base_personality)
         
         # 自动加载/初始化状态（核心：state目录自动创建）
         self._load_state()
@@ -39,6 +54,8 @@ class Character:
             "negative": -8,  # 提敏感话题/怼她 → -8
             "neutral": 1     # 日常闲聊 → +1（缓慢恢复）
         }
+        # 情感倾向快速判断词典（置信度不足时才调用模型）
+        self.emotion_lexicon = EmotionLexicon()
 
     def _load_state(self):
         """自动创建state目录+加载状态，无文件则初始化"""
@@ -80,9 +97,16 @@ class Character:
             print(f"⚠️ 保存芙宁娜状态失败：{e}")
 
     def _update_emotion_value(self, user_input):
-        """根据用户消息自动更新情感值（无暂停，发消息即恢复）"""
-        # 构建情感判断提示词
-        emotion_prompt = f"""
+        """
+        根据用户消息自动更新情感值（无暂停，发消息即恢复）
+        先用本地词典快速判断倾向，置信度不足时才调用模型；返回(倾向, 判断来源)，失败返回None
+        """
+        emotion_tendency = self.emotion_lexicon.classify(user_input) if EMOTION_FAST_PATH_ENABLED else None
+        source = "lexicon" if emotion_tendency else "model"
+        try:
+            if emotion_tendency is None:
+                # 构建情感判断提示词
+                emotion_prompt = f"""
         角色：芙宁娜，用户是旅行者
         请判断以下用户消息对芙宁娜的情感倾向，仅输出positive/negative/neutral：
         用户消息：{user_input}
@@ -92,19 +116,12 @@ class Character:
         - negative：提水神/审判/500年、怼她、说她傻；
         - neutral：天气/吃饭/日常问候等闲聊。
         """
-        try:
-            # 调用本地文本模型判断情感倾向
-            import subprocess
-            result = subprocess.run(
-                [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", emotion_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            emotion_tendency = result.stdout.strip().lower()
-            # 限制倾向值范围（防止模型输出异常）
-            if emotion_tendency not in ["positive", "negative", "neutral"]:
-                emotion_tendency = "neutral"
+                # 调用本地文本模型判断情感倾向
+                emotion_tendency = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", emotion_prompt).strip().lower()
+                # 限制倾向值范围（防止模型输出异常）
+                if emotion_tendency not in ["positive", "negative", "neutral"]:
+                    emotion_tendency = "neutral"
+            self.emotion_lexicon.record(source)
             
             # 更新情感值（限制0-100）
             self.emotion_value += self.emotion_change_rules_custom.get(emotion_tendency, 1)
@@ -112,11 +129,15 @@ class Character:
             
             # 自动保存状态
             self._save_state()
-            print(f"❤️ 芙宁娜情感值更新：{self.emotion_value}（倾向：{emotion_tendency}）")
+            source_tip = "词典判断" if source == "lexicon" else "模型判断"
+            print(f"❤️ 芙宁娜情感值更新：{self.emotion_value}（倾向：{emotion_tendency}，{source_tip}）")
+            return emotion_tendency, source
         except Exception as e:
+            self.emotion_lexicon.record("failed")
             print(f"⚠️ 情感值更新失败：{e} → 默认+1恢复")
             self.emotion_value = min(self.emotion_value + 1, 100)
             self._save_state()
+            return None
 
     def _get_low_emotion_reply(self):
         """情感值过低时的委屈回复（无暂停，新消息可恢复）"""
@@ -155,14 +176,7 @@ class Character:
         4. 傲娇但不傲不娇。
         """
         try:
-            import subprocess
-            result = subprocess.run(
-                [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", active_topic_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            active_topic = result.stdout.strip()
+            active_topic = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", active_topic_prompt).strip()
             # 重置被动聊天计数
             self.passive_chat_count = 0
             self._save_state()
@@ -171,9 +185,9 @@ class Character:
             print(f"⚠️ 生成主动话题失败：{e} → 用默认话题")
             return "说起来，你最近有没有发现枫丹的新鲜事？"
 
-    def _check_ooc(self, reply):
-        """检查回复是否OOC（偏离退休芙宁娜人设）"""
-        ooc_prompt = f"""
+    def _build_ooc_prompt(self, reply):
+        """构建OOC打分提示词"""
+        return f"""
         芙宁娜核心人设：{self.base_personality}
         待判断回复：{reply}
         请判断该回复是否偏离人设，仅输出0-1的数字（1=完全OOC，0=完全符合）。
@@ -181,22 +195,106 @@ class Character:
         1. 符合：日常温和、带不经意萌点、聊喜好/好友、无神明词汇；
         2. 偏离：用「本神明」「审判」等词汇、语气夸张戏剧化、不符合普通居民状态。
         """
+
+    def _check_ooc(self, reply):
+        """检查回复是否OOC（偏离退休芙宁娜人设）：先本地预检，命中禁忌词直接判定OOC，干净回复多数跳过模型打分"""
+        if OOC_FAST_CHECK_ENABLED:
+            verdict, banned_hits = self.ooc_guard.check(reply)
+            if verdict == "banned":
+                print(f"🚫 回复含禁忌词{sorted(set(banned_hits))} → 直接调整")
+                return False
+            if verdict == "pass":
+                return True
         try:
-            import subprocess
-            result = subprocess.run(
-                [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", ooc_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            ooc_score = float(result.stdout.strip())
+            ooc_score = float(infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", self._build_ooc_prompt(reply)).strip())
             return ooc_score < self.ooc_threshold
         except Exception as e:
             print(f"⚠️ OOC检查失败：{e} → 默认符合人设")
             return True
 
-    def get_response(self, user_input):
-        """生成芙宁娜最终回复（核心方法）"""
+    def _generate_reply_text(self, reply_prompt, on_chunk=None):
+        """调用模型生成一条回复（传入on_chunk时流式输出），失败时抛出异常"""
+        if on_chunk is None:
+            return infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", reply_prompt).strip()
+        chunks = []
+        for chunk in stream_infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", reply_prompt):
+            # 开头的空白不输出（与非流式strip后的结果保持一致）
+            if not chunks:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+            chunks.append(chunk)
+            on_chunk(chunk)
+        return "".join(chunks).strip()
+
+    def _generate_candidates(self, reply_prompt, on_chunk=None):
+        """
+        并发生成REPLY_CANDIDATE_COUNT条候选：第1条照常生成（可流式输出），其余候选同时一次批量推理
+        其余候选各带不同的表达要求和采样seed，保证候选之间有差异
+        返回(候选列表, 第1条是否已流式输出)，候选列表第1条在前，生成失败的候选不包含在内
+        """
+        extra_prompts, extra_options = [], []
+        for index in range(1, REPLY_CANDIDATE_COUNT):
+            hint = CANDIDATE_VARIATION_HINTS[(index - 1) % len(CANDIDATE_VARIATION_HINTS)]
+            extra_prompts.append(f"{reply_prompt}附加要求：{hint}。\n")
+            extra_options.append({"seed": index, "temperature": REPLY_CANDIDATE_TEMPERATURE})
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="reply-candidates") as executor:
+            extra_future = executor.submit(batch_infer, f"{TEXT_CHAT_MODEL_PATH}/infer.py", extra_prompts, extra_options)
+            candidates = []
+            first_streamed = False
+            try:
+                first_reply = self._generate_reply_text(reply_prompt, on_chunk)
+                candidates.append(first_reply)
+                first_streamed = on_chunk is not None and bool(first_reply)
+            except Exception as e:
+                print(f"⚠️ 生成芙宁娜回复失败：{e} → 使用其他候选")
+            try:
+                candidates.extend(output.strip() for output in extra_future.result())
+            except Exception as e:
+                print(f"⚠️ 批量生成候选回复失败：{e}")
+        return [candidate for candidate in candidates if candidate], first_streamed
+
+    def _select_candidate(self, candidates, keep_first=False):
+        """
+        一次挑选：本地预检排除含禁忌词的候选，无风险的候选直接选用（靠前的优先）
+        需要打分的候选一次批量打分，选分数最低且低于阈值的；返回(回复, 是否符合人设)
+        keep_first为True（第1条已流式输出）时，第1条只要打分通过就优先选用，避免重新输出回复
+        """
+        verdicts = [
+            self.ooc_guard.check(candidate)[0] if OOC_FAST_CHECK_ENABLED else "score"
+            for candidate in candidates
+        ]
+        first_pass = next((c for c, verdict in zip(candidates, verdicts) if verdict == "pass"), None)
+        # 第1条已流式输出且需要打分时，先打分再看其他无风险候选
+        if first_pass is not None and not (keep_first and verdicts[0] == "score"):
+            return first_pass, True
+        to_score = [c for c, verdict in zip(candidates, verdicts) if verdict == "score"]
+        if not to_score:
+            print(f"🚫 {len(candidates)}条候选回复均含禁忌词 → 调整回复")
+            return candidates[0], False
+        try:
+            outputs = batch_infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", [self._build_ooc_prompt(c) for c in to_score])
+            scores = []
+            for output in outputs:
+                try:
+                    scores.append(float(output.strip()))
+                except ValueError:
+                    scores.append(1.0)  # 输出异常的候选视为OOC
+        except Exception as e:
+            print(f"⚠️ OOC检查失败：{e} → 默认符合人设")
+            return to_score[0], True
+        if keep_first and verdicts[0] == "score" and scores[0] < self.ooc_threshold:
+            return candidates[0], True
+        if first_pass is not None:
+            return first_pass, True
+        best_score, best_candidate = min(zip(scores, to_score), key=lambda pair: pair[0])
+        return best_candidate, best_score < self.ooc_threshold
+
+    def get_response(self, user_input, input_anchors=None, on_chunk=None):
+        """
+        生成芙宁娜最终回复（核心方法，input_anchors为提前提取好的输入锚点词）
+        传入on_chunk时流式生成：模型每输出一段就调用on_chunk(片段)，返回值仍是完整的最终回复（OOC调整后可能与已输出内容不同）
+        """
         # 1. 情感值过低时，返回委屈回复（新消息会自动恢复）
         if self.emotion_value < EMOTION_VALUE_THRESHOLD:
             return self._get_low_emotion_reply()
@@ -207,12 +305,15 @@ class Character:
         if self.passive_chat_count >= ACTIVE_TOPIC_TRIGGER_COUNT:
             return self._generate_active_topic()
         
-        # 3. 检索所有相关记忆
-        related_memory = self.memory_manager.retrieve_all_related_memory(user_input)
+        # 3. 检索所有相关记忆，按相关度在字数预算内挑选（提示词长度不随记忆增长）
+        related_memory = self.memory_manager.retrieve_all_related_memory(user_input, input_anchors)
+        memory_context, context_report = build_memory_context(related_memory)
+        print(
+            f"🧠 记忆上下文：{context_report['candidates']}条候选，选用{context_report['selected']}条（{context_report['chars']}字），"
+            f"超出预算舍弃{context_report['dropped']}条，重复{context_report['duplicates']}条"
+        )
         memory_content = f"""
-        核心记忆：{[item['content'] for item in related_memory.get('core', [])]}
-        长期记忆：{[item['content'] for item in related_memory.get('long_term', [])]}
-        近期聊天：{[item['content'] for item in related_memory.get('temporary', [])]}
+        {memory_context}
         """
         
         # 4. 构建回复生成提示词（
@@ -233,22 +334,23 @@ class Character:
            - 低值（40-30）：委屈但不矫情，比如「唔…不要提以前的事啦…」。
         """
         
-        # 5. 生成初始回复
-        try:
-            import subprocess
-            result = subprocess.run(
-                [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", reply_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            final_reply = result.stdout.strip()
-        except Exception as e:
-            print(f"⚠️ 生成芙宁娜回复失败：{e}")
-            final_reply = "哎呀，我现在有点懵，你再说一遍？"
+        # 5. 生成初始回复（REPLY_CANDIDATE_COUNT>1时并发生成多条候选，挑选一条符合人设的）
+        if REPLY_CANDIDATE_COUNT > 1:
+            candidates, first_streamed = self._generate_candidates(reply_prompt, on_chunk)
+            if candidates:
+                final_reply, in_character = self._select_candidate(candidates, keep_first=first_streamed)
+            else:
+                final_reply, in_character = "哎呀，我现在有点懵，你再说一遍？", True
+        else:
+            try:
+                final_reply = self._generate_reply_text(reply_prompt, on_chunk)
+            except Exception as e:
+                print(f"⚠️ 生成芙宁娜回复失败：{e}")
+                final_reply = "哎呀，我现在有点懵，你再说一遍？"
+            in_character = self._check_ooc(final_reply)
         
-        # 6. OOC检查+调整
-        if not self._check_ooc(final_reply):
+        # 6. OOC调整（候选模式下只有全部候选都不符合人设时才调整）
+        if not in_character:
             adjust_prompt = f"""
             芙宁娜核心人设：{self.base_personality}
             不符合人设的回复：{final_reply}
@@ -260,13 +362,7 @@ class Character:
             4. 符合普通居民状态，傲娇但不傲不娇。
             """
             try:
-                adjust_result = subprocess.run(
-                    [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", adjust_prompt],
-                    capture_output=True,
-                    text=True,
-                    encoding="utf-8"
-                )
-                final_reply = adjust_result.stdout.strip()
+                final_reply = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", adjust_prompt).strip()
             except Exception as e:
                 print(f"⚠️ 调整OOC回复失败：{e}")
                 final_reply = "（挠头）唔…我是不是说错了？"
@@ -296,19 +392,27 @@ class Character:
 
     def learn_from_producer_feedback(self, feedback_content):
         """从制作人反馈中学习优化回复"""
-        from utils.file_operations import extract_anchor_words_via_model
+        from utils.file_operations import extract_anchor_words_many
         try:
+            # 过滤无效反馈项
+            valid_items = []
             for feedback_item in feedback_content:
+                # 制作人追加的禁忌词（可选字段banned_terms）
+                new_terms = self.ooc_guard.add_banned_terms(feedback_item.get("banned_terms", []))
+                if new_terms:
+                    print(f"✅ 新增禁忌词：{new_terms}")
                 user_input = feedback_item.get("user_input", "")
                 correct_reply = feedback_item.get("correct_response", "")
                 if not user_input or not correct_reply:
                     continue
-                # 提取锚点词
-                anchor_words = extract_anchor_words_via_model(
-                    text=f"{user_input} {correct_reply}",
-                    model_path=MEMORY_MODEL_PATH,
-                    max_num=ANCHOR_WORD_MAX_NUM
-                )
+                valid_items.append((user_input, correct_reply))
+            # 批量提取锚点词（整份反馈文件合并为少量模型调用）
+            anchor_words_list = extract_anchor_words_many(
+                [f"{user_input} {correct_reply}" for user_input, correct_reply in valid_items],
+                model_path=MEMORY_MODEL_PATH,
+                max_num=ANCHOR_WORD_MAX_NUM
+            )
+            for (user_input, correct_reply), anchor_words in zip(valid_items, anchor_words_list):
                 # 更新记忆
                 self.memory_manager.update_memory_by_anchor(
                     anchor_words=anchor_words,
@@ -318,8 +422,22 @@ class Character:
                 # 更新人设（如有性格调整）
                 if "性格" in correct_reply or "调整" in correct_reply:
                     self.base_personality = f"{self.base_personality}\n制作人调整：{correct_reply}"
+                    self.ooc_guard.rebuild(self.base_personality)
             print("✅ 芙宁娜已从制作人反馈中完成学习！")
             return True
         except Exception as e:
             print(f"⚠️ 芙宁娜学习反馈失败：{e}")
-            return False
\ No newline at end of file
+            return False
+
+# 角色注册表：每个character_id只有一个Character实例
+_characters = {}
+_characters_lock = threading.Lock()
+
+def get_character(character_id="furenna"):
+    """获取角色共享的Character实例（首次调用时创建）"""
+    with _characters_lock:
+        character = _characters.get(character_id)
+        if character is None:
+            character = Character(character_id)
+            _characters[character_id] = character
+        return character
\ No newline at end of file
@@ -0,0 +1,86 @@
+# /root/ai_character/character/ooc_guard.py
+import random
+import re
+import threading
+from utils.keyword_matcher import AhoCorasick
+from config import OOC_BANNED_TERMS, OOC_AUDIT_SAMPLE_RATE
+
+# 风格风险标记：神明时期的戏剧化用词（不一定OOC，命中时交给模型打分）
+# 歌剧相关词（舞台/演出等）是日常喜好话题，不作为风险标记
+OOC_RISK_MARKERS = [
+    "神明", "神座", "众神", "凡人", "吾", "汝", "本小姐", "罪人", "律法", "预言", "哈哈哈",
+]
+# 人设中「禁忌」一行里用「」括起来的词
+_TABOO_LINE_PATTERN = re.compile(r"禁忌[^\n]*")
+_QUOTED_TERM_PATTERN = re.compile(r"「([^」]+)」")
+# 夸张标点/表情：连续感叹问号、emoji
+_EXAGGERATED_PUNCTUATION = re.compile(r"[！!？?]{2,}|[\U0001F300-\U0001FAFF☀-➿]")
+# 波浪线/句子数超过回复要求（少量波浪线，1-3句话）
+MAX_TILDES = 2
+MAX_SENTENCES = 3
+_SENTENCE_END_PATTERN = re.compile(r"[。！？!?~～]+")
+
+def extract_taboo_terms(personality):
+    """从人设文本的「禁忌」行中提取禁忌词（包括制作人追加的调整）"""
+    terms = []
+    for line in _TABOO_LINE_PATTERN.findall(personality or ""):
+        terms.extend(_QUOTED_TERM_PATTERN.findall(line))
+    return terms
+
+class OOCGuard:
+    """
+    OOC本地预检（在模型打分之前执行）：
+      banned：命中禁忌词 → 直接判定OOC，跳过打分直接调整
+      score：命中风格风险标记/夸张标点 → 交给模型打分
+      pass：干净的回复跳过打分，但按OOC_AUDIT_SAMPLE_RATE抽样交给模型复查（结果为score）
+    禁忌词 = 人设「禁忌」行中的词 + OOC_BANNED_TERMS + 制作人反馈追加的词，预编译成Aho-Corasick自动机
+    """
+    def __init__(self, personality, audit_sample_rate=OOC_AUDIT_SAMPLE_RATE):
+        self.audit_sample_rate = audit_sample_rate
+        self.producer_terms = []
+        self.risk_matcher = AhoCorasick(OOC_RISK_MARKERS)
+        self.stats = {"banned": 0, "scored": 0, "audited": 0, "skipped": 0}
+        self._stats_lock = threading.Lock()
+        self.rebuild(personality)
+
+    def rebuild(self, personality):
+        """人设变化后重新编译禁忌词自动机"""
+        self.banned_matcher = AhoCorasick(
+            extract_taboo_terms(personality) + list(OOC_BANNED_TERMS) + self.producer_terms
+        )
+
+    def add_banned_terms(self, terms):
+        """追加制作人指定的禁忌词"""
+        new_terms = [term for term in terms if term and term not in self.producer_terms]
+        if new_terms:
+            self.producer_terms.extend(new_terms)
+            self.banned_matcher.add_keywords(new_terms)
+        return new_terms
+
+    def _has_style_risk(self, reply):
+        if self.risk_matcher.contains_any(reply) or _EXAGGERATED_PUNCTUATION.search(reply):
+            return True
+        tilde_count = reply.count("~") + reply.count("～")
+        return tilde_count > MAX_TILDES or len(_SENTENCE_END_PATTERN.findall(reply)) > MAX_SENTENCES
+
+    def check(self, reply):
+        """返回(判定, 命中的禁忌词)：判定为banned / score / pass"""
+        banned_hits = self.banned_matcher.find_all(reply)
+        if banned_hits:
+            verdict = "banned"
+        elif self._has_style_risk(reply):
+            verdict = "scored"
+        elif random.random() < self.audit_sample_rate:
+            verdict = "audited"
+        else:
+            verdict = "skipped"
+        with self._stats_lock:
+            self.stats[verdict] += 1
+        if verdict in ("scored", "audited"):
+            return "score", banned_hits
+        return ("banned" if verdict == "banned" else "pass"), banned_hits
+
+    def skip_rate(self):
+        """跳过模型打分的比例（禁忌词直接判定+干净回复未抽中复查）"""
+        total = sum(self.stats.values())
+        return (self.stats["banned"] + self.stats["skipped"]) / total if total else 0.0
\ No newline at end of file
@@ -1,5 +1,118 @@
 # /root/ai_character/main.py
 import os
+
+# ========== 本地推理进程池配置 ==========
+# worker：常驻推理进程池（模型只加载一次）；oneshot：每次调用单独启动infer进程（旧模式）
+INFER_WORKER_MODE = "worker"
+# 每个模型的常驻推理进程数量
+INFER_WORKER_POOL_SIZE = 2
+# 批量推理时单次模型调用最多携带的提示词数量
+INFER_BATCH_MAX_SIZE = 32
+# 常驻推理进程单次请求的超时时间（秒；流式为两段输出之间的间隔），超时视为进程卡死：重启进程并改用一次性推理完成本次调用
+INFER_REQUEST_TIMEOUT = 120
+
+# 回复流式输出：模型边生成边打印到终端（OOC调整后的回复会重新输出）
+REPLY_STREAMING = True
+
+# ========== 记忆存储配置 ==========
+# 追加日志中的过期记录（被更新/删除覆盖）超过该条数时自动压缩
+MEMORY_JOURNAL_COMPACT_THRESHOLD = 500
+# 记忆存储后端：journal（追加日志，默认）/ sqlite（SQLite+FTS5全文检索，首次启用自动导入）
+MEMORY_STORAGE_BACKEND = "journal"
+# 临时记忆最多保留的条数（超出后淘汰最旧的），0为不限制（只按过期天数清理）
+TEMP_MEMORY_MAX_ENTRIES = 0
+# 回复提示词中记忆上下文的字数预算（中文约1字≈1 token），按相关度挑选记忆直到用完预算
+MEMORY_CONTEXT_MAX_CHARS = 1200
+# 参与挑选的临时记忆只取最近的条数
+MEMORY_CONTEXT_TEMP_WINDOW = 50
+# 记忆检索方式：anchor（锚点词精确匹配）/ vector（向量检索，查询不再调用锚点词提取模型）/ hybrid（两者合并）
+# vector/hybrid需要numpy，未安装时自动回退到anchor
+MEMORY_RETRIEVAL_MODE = "anchor"
+# 向量编码器：hashed（字n-gram哈希TF-IDF，无额外依赖）或本地sentence-transformers模型目录（仅CPU）
+MEMORY_VECTOR_ENCODER = "hashed"
+# 哈希向量维度
+MEMORY_VECTOR_DIM = 2048
+# 每层记忆向量检索返回的条数/最低余弦相似度
+MEMORY_VECTOR_TOP_K = 5
+MEMORY_VECTOR_MIN_SCORE = 0.2
+# 锚点未命中时全文检索兜底返回的条数（仅sqlite后端）
+MEMORY_FTS_FALLBACK_LIMIT = 5
+# 后台记忆维护（梳理/过期清理/跨天总结）：True时启动与退出不再等待记忆梳理
+MEMORY_BACKGROUND_MAINTENANCE = True
+# 后台维护定时检查间隔（秒）
+MEMORY_MAINTENANCE_INTERVAL = 600
+# 用户空闲超过该秒数后执行一次维护
+MEMORY_MAINTENANCE_IDLE_SECONDS = 60
+# 记忆梳理时并发合并锚点分组的线程数（实际并发还受记忆模型常驻进程数INFER_WORKER_POOL_SIZE限制）
+MEMORY_COMB_WORKERS = 2
+# 每个并发任务一次批量合并的分组数
+MEMORY_COMB_CHUNK_SIZE = 8
+
+# ========== 聊天记录配置 ==========
+# 每日聊天记录为JSONL（每条一行），缓冲追加写入：满批量条数或超过间隔秒数时写入文件（跨天/退出时必定写入）
+CHAT_LOG_FLUSH_INTERVAL = 5
+CHAT_LOG_FLUSH_BATCH_SIZE = 20
+# 每次写入后fsync（断电不丢已写入的记录）
+CHAT_LOG_FSYNC = True
+# 每日总结分块（map-reduce）：聊天记录按字数/轮数切块并发总结，再合并为最终总结
+SUMMARY_CHUNK_MAX_CHARS = 3000
+SUMMARY_CHUNK_MAX_TURNS = 40
+# 分块并发总结的线程数（每个线程占用一个文本模型推理进程）
+SUMMARY_WORKERS = 2
+# 聊天过程中每满一块就在后台总结（跨天/退出时只需总结剩余部分并合并）
+SUMMARY_INCREMENTAL = True
+# 周/月聊天汇总的字数上限（由每日总结合并生成并缓存，/summary 开始日期..结束日期 查询）
+SUMMARY_WEEKLY_MAX_CHARS = 100
+SUMMARY_MONTHLY_MAX_CHARS = 150
+
+# ========== 情感判断配置 ==========
+# 情感倾向快速判断：先用本地关键词/n-gram词典打分，置信度不足时才调用文本模型
+EMOTION_FAST_PATH_ENABLED = True
+# 词典判断的置信度阈值（0-1），低于该值改用模型判断
+EMOTION_FAST_PATH_CONFIDENCE = 0.6
+# 自定义词典+聊天记录训练结果（JSON，文件不存在时只用内置词典）
+EMOTION_LEXICON_PATH = "/root/ai_character/state/emotion_lexicon.json"
+# 从聊天记录学习n-gram时，至少在多少条模型判断过的消息中出现才收录
+EMOTION_LEXICON_MIN_COUNT = 3
+
+# ========== OOC检查配置 ==========
+# OOC本地预检：回复命中禁忌词直接调整，不再调用模型打分；无风格风险的回复跳过打分
+OOC_FAST_CHECK_ENABLED = True
+# 跳过打分的干净回复中，仍按该比例抽样交给模型复查
+OOC_AUDIT_SAMPLE_RATE = 0.1
+# 额外禁忌词（人设「禁忌」一行中「」括起来的词会自动加入）
+OOC_BANNED_TERMS = ["本神明"]
+# 每轮并发生成的候选回复数：>1时第1条照常（流式）生成，其余候选同时批量生成，
+# 本地预检+一次批量打分挑选符合人设的候选，全部不符合时才调用调整提示词；1为旧模式（逐条生成→打分→调整）
+REPLY_CANDIDATE_COUNT = 3
+# 额外候选的采样温度（每条候选另带不同的seed，提示词也各加一条不同的表达要求，保证候选之间有差异）
+REPLY_CANDIDATE_TEMPERATURE = 0.9
+
+# ========== 语音合成配置 ==========
+# 分句流式合成：回复按。！？~分句，后台逐句合成，第一句合成完即开始播放
+TTS_SENTENCE_STREAMING = True
+# 语音后台播放：播放时可继续输入；VOICE_BARGE_IN为True时新消息会打断当前语音
+VOICE_PLAYBACK_ASYNC = True
+VOICE_BARGE_IN = True
+# GPT-SoVITS合成模式：worker（常驻合成进程，语音模型只加载一次）/ oneshot（每次启动infer.py）
+SOVITS_WORKER_MODE = "worker"
+# 常驻合成进程空闲超过该秒数后，合成前先做健康检查（无响应自动重启）
+SOVITS_HEALTH_CHECK_INTERVAL = 60
+# 健康检查/单次合成的超时时间（秒），超时视为进程卡死并重启
+SOVITS_PING_TIMEOUT = 10
+SOVITS_REQUEST_TIMEOUT = 120
+# 语音合成缓存：相同文本+语音参数直接复用已合成的wav（存放在VOICE_OUTPUT_PATH/cache）
+TTS_CACHE_ENABLED = True
+# 语音缓存总大小上限（字节），超出后淘汰最久未用的文件
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# ========== 锚点词缓存配置 ==========
+# 相同文本的锚点词提取结果缓存（进程内LRU+磁盘持久化），记忆模型变化时自动失效
+ANCHOR_CACHE_ENABLED = True
+ANCHOR_CACHE_PATH = "/root/ai_character/cache/anchor_cache.db"
+# 进程内LRU最多保留的条目数
+ANCHOR_CACHE_MAX_ENTRIES = 2048
+
 from character.character import Character
 from prompt.chat_logger import ChatLogger
 from prompt.producer_feedback import ProducerFeedback
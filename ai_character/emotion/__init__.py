@@ -2,5 +2,6 @@
 # 情绪/表情包模块包初始化
 from .emotion_manager import EmotionManager
 from .emoji_manager import EmojiManager
+from .emotion_lexicon import EmotionLexicon
 
-__all__ = ["EmotionManager", "EmojiManager"]
\ No newline at end of file
+__all__ = ["EmotionManager", "EmojiManager", "EmotionLexicon"]
\ No newline at end of file
@@ -0,0 +1,184 @@
+# /root/ai_character/emotion/emotion_lexicon.py
+import glob
+import json
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from utils.jsonl_writer import iter_jsonl
+from config import (
+    CHAT_LOG_PATH, EMOTION_LEXICON_PATH, EMOTION_FAST_PATH_CONFIDENCE, EMOTION_LEXICON_MIN_COUNT
+)
+
+EMOTION_LABELS = ("positive", "negative", "neutral")
+
+# 内置词典（与情感判断提示词中的规则一致）：{倾向: {词: 权重}}
+DEFAULT_EMOTION_LEXICON = {
+    "positive": {
+        # 喜好：甜品/歌剧/购物/旅游/小说
+        "甜品": 1.0, "千灵慕斯": 1.0, "马卡龙": 1.0, "小饼干": 1.0, "小蛋糕": 1.0, "蛋糕": 1.0,
+        "歌剧": 1.0, "购物": 1.0, "逛街": 1.0, "旅游": 1.0, "小说": 0.8,
+        # 好友
+        "娜维亚": 1.0, "那维莱特": 1.0, "克洛琳德": 1.0, "爱可菲": 1.0, "林尼": 1.0, "派蒙": 1.0,
+        # 安慰/夸奖
+        "可爱": 1.0, "好萌": 1.0, "真萌": 1.0, "厉害": 1.0, "真棒": 1.0, "好棒": 1.0, "喜欢你": 1.0,
+        "别难过": 1.0, "抱抱": 1.0, "辛苦了": 1.0, "谢谢": 0.8,
+    },
+    "negative": {
+        # 禁忌话题
+        "水神": 1.0, "审判": 1.0, "500年": 1.0, "五百年": 1.0, "神明": 1.0,
+        # 怼她/说她傻
+        "傻": 1.0, "笨": 1.0, "蠢": 1.0, "讨厌你": 1.0, "闭嘴": 1.0, "滚": 1.0, "没用": 1.0,
+    },
+    "neutral": {
+        # 天气/吃饭/日常问候
+        "天气": 0.8, "下雨": 0.8, "吃饭": 0.8, "吃了吗": 0.8, "你好": 0.8, "在吗": 0.8,
+        "早上好": 0.8, "早安": 0.8, "中午好": 0.8, "晚上好": 0.8, "晚安": 0.8, "睡觉": 0.8,
+    },
+}
+
+# 置信度平滑项：只命中一个权重1.0的词时置信度约0.67，正负词同时命中时置信度明显下降
+CONFIDENCE_SMOOTHING = 0.5
+# 聊天记录学到的n-gram权重折扣（单个学习词不足以跳过模型，需多个同向命中）
+LEARNED_WEIGHT_SCALE = 0.5
+# 学习n-gram的长度范围与纯度要求（该n-gram出现的消息中同一倾向的占比）
+LEARNED_NGRAM_SIZES = (2, 3)
+LEARNED_MIN_PURITY = 0.8
+# 否定词：命中词前NEGATION_WINDOW个字内（同一分句）出现否定词时倾向可能反转（「一点都不可爱」「不喜欢」），交给模型判断
+NEGATION_CUES = re.compile(r"[不没别无非勿]")
+NEGATION_WINDOW = 4
+# 只含标点/空白的n-gram不收录
+_PUNCTUATION_ONLY = re.compile(r"^[\W_]+$")
+_CLAUSE_BREAK = re.compile(r"[\W_]")
+
+class EmotionLexicon:
+    """
+    情感倾向快速判断：所有词编译成一个正则（长词优先），一次扫描得到各倾向得分
+    置信度 = 最高得分 / (总得分 + 平滑项)，达到阈值直接返回倾向，否则交给模型判断
+    命中词前面有否定词时置信度记为0（否定会反转倾向，词典无法判断）
+    词典 = 内置词典 + EMOTION_LEXICON_PATH中的自定义词（terms）+ 聊天记录学到的n-gram（learned）
+    """
+    def __init__(self, lexicon_path=EMOTION_LEXICON_PATH, threshold=EMOTION_FAST_PATH_CONFIDENCE):
+        self.lexicon_path = lexicon_path
+        self.threshold = threshold
+        self.custom_terms = {label: {} for label in EMOTION_LABELS}
+        self.learned_terms = {label: {} for label in EMOTION_LABELS}
+        self.stats = {"lexicon": 0, "model": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self._load()
+        self._compile()
+
+    def _load(self):
+        """加载自定义词典/学习结果（文件不存在时只用内置词典）"""
+        if not self.lexicon_path or not os.path.exists(self.lexicon_path):
+            return
+        try:
+            with open(self.lexicon_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for label in EMOTION_LABELS:
+                self.custom_terms[label] = dict(data.get("terms", {}).get(label, {}))
+                self.learned_terms[label] = dict(data.get("learned", {}).get(label, {}))
+        except Exception as e:
+            print(f"⚠️ 加载情感词典失败：{e} → 只使用内置词典")
+
+    def save(self):
+        """保存自定义词典+学习结果"""
+        os.makedirs(os.path.dirname(self.lexicon_path), exist_ok=True)
+        tmp_path = f"{self.lexicon_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"terms": self.custom_terms, "learned": self.learned_terms}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.lexicon_path)
+
+    def _compile(self):
+        """合并三层词典（自定义 > 内置 > 学习），编译成一个正则"""
+        weights = {}
+        for layer, scale in ((self.learned_terms, LEARNED_WEIGHT_SCALE), (DEFAULT_EMOTION_LEXICON, 1.0), (self.custom_terms, 1.0)):
+            for label in EMOTION_LABELS:
+                for term, weight in layer.get(label, {}).items():
+                    term = term.strip().lower()
+                    if term:
+                        weights[term] = (label, float(weight) * scale)
+        terms = sorted(weights, key=len, reverse=True)
+        pattern = re.compile("|".join(re.escape(term) for term in terms)) if terms else None
+        # 一次性替换，判断线程不会看到编译到一半的词典
+        self._compiled = (pattern, weights)
+
+    @staticmethod
+    def _is_negated(text, start):
+        """命中词前的NEGATION_WINDOW个字内（不跨标点）是否有否定词"""
+        window = text[max(0, start - NEGATION_WINDOW):start]
+        clause = _CLAUSE_BREAK.split(window)[-1]
+        return bool(NEGATION_CUES.search(clause))
+
+    def score(self, text):
+        """词典打分，返回(倾向, 置信度)；没有命中任何词时返回(None, 0.0)，命中词被否定时置信度为0.0"""
+        pattern, weights = self._compiled
+        if pattern is None or not text:
+            return None, 0.0
+        text = text.lower()
+        scores = defaultdict(float)
+        negated = False
+        for match in pattern.finditer(text):
+            label, weight = weights[match.group(0)]
+            scores[label] += weight
+            negated = negated or self._is_negated(text, match.start())
+        if not scores:
+            return None, 0.0
+        label = max(scores, key=scores.get)
+        if negated:
+            return label, 0.0
+        return label, scores[label] / (sum(scores.values()) + CONFIDENCE_SMOOTHING)
+
+    def classify(self, text):
+        """置信度达到阈值时返回倾向，否则返回None（由调用方调用模型判断）"""
+        label, confidence = self.score(text)
+        return label if confidence >= self.threshold else None
+
+    def record(self, source):
+        """记录一次判断的来源：lexicon（词典快速判断）/ model（模型判断）/ failed（判断失败）"""
+        with self._stats_lock:
+            self.stats[source] += 1
+
+    def hit_rate(self):
+        """快速判断命中率（词典判断 / 总判断次数）"""
+        total = sum(self.stats.values())
+        return self.stats["lexicon"] / total if total else 0.0
+
+    def train_from_chat_logs(self, log_dir=CHAT_LOG_PATH, character_id="furenna", min_count=EMOTION_LEXICON_MIN_COUNT):
+        """
+        从聊天记录学习n-gram：只使用模型判断过倾向的消息（emotion_source=model），避免词典自我强化
+        n-gram在至少min_count条消息中出现且同一倾向占比达到LEARNED_MIN_PURITY时收录，返回收录的词数
+        """
+        label_counts = defaultdict(Counter)  # {n-gram: {倾向: 出现的消息数}}
+        for log_file in sorted(glob.glob(os.path.join(log_dir, f"{character_id}_chat_*.jsonl"))):
+            for item in iter_jsonl(log_file):
+                label = item.get("emotion_tendency")
+                if item.get("emotion_source") != "model" or label not in EMOTION_LABELS:
+                    continue
+                text = item.get("user_input", "").lower()
+                ngrams = {
+                    text[start:start + size]
+                    for size in LEARNED_NGRAM_SIZES
+                    for start in range(len(text) - size + 1)
+                }
+                for ngram in ngrams:
+                    if not _PUNCTUATION_ONLY.match(ngram):
+                        label_counts[ngram][label] += 1
+
+        learned_terms = {label: {} for label in EMOTION_LABELS}
+        # 短n-gram优先：已被同倾向的子串覆盖的长n-gram不再重复收录
+        for ngram in sorted(label_counts, key=len):
+            counts = label_counts[ngram]
+            total = sum(counts.values())
+            label, count = counts.most_common(1)[0]
+            purity = count / total
+            if total < min_count or purity < LEARNED_MIN_PURITY:
+                continue
+            if any(term in ngram for term in learned_terms[label]):
+                continue
+            learned_terms[label][ngram] = round(purity, 3)
+
+        self.learned_terms = learned_terms
+        self._compile()
+        self.save()
+        return sum(len(terms) for terms in learned_terms.values())
\ No newline at end of file
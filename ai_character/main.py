@@ -1,23 +1,31 @@
 # /root/ai_character/main.py
 import os
-from character.character import Character
+from character.character import get_character
 from prompt.chat_logger import ChatLogger
 from prompt.producer_feedback import ProducerFeedback
 from voice.speak_finish import SpeakFinish
 from emotion.emoji_manager import EmojiManager
-from memory.memory_manager import MemoryManager
-from config import EMOTION_VALUE_THRESHOLD
+from memory.memory_manager import get_memory_manager
+from memory.memory_maintainer import MemoryMaintainer
+from pipeline.turn_pipeline import TurnPipeline
+from config import EMOTION_VALUE_THRESHOLD, MEMORY_BACKGROUND_MAINTENANCE, VOICE_BARGE_IN
 
 def main():
     """芙宁娜与旅行者聊天主程序：无暂停+一直运行+自动总结"""
     # 初始化核心模块
     character_id = "furenna"
-    furenna = Character(character_id)
+    # 芙宁娜/记忆管理器从注册表获取，与语音模块共用同一份记忆
+    furenna = get_character(character_id)
     chat_logger = ChatLogger(character_id)
     producer_feedback = ProducerFeedback(character_id)
-    speak_finish = SpeakFinish()
+    speak_finish = SpeakFinish(character_id)
     emoji_manager = EmojiManager()
-    memory_manager = MemoryManager(character_id)
+    memory_manager = get_memory_manager(character_id)
+    turn_pipeline = TurnPipeline(furenna, emoji_manager, speak_finish, chat_logger)
+    # 后台记忆维护（梳理/过期清理/跨天总结），启动不等待
+    memory_maintainer = MemoryMaintainer(memory_manager, chat_logger)
+    if MEMORY_BACKGROUND_MAINTENANCE:
+        memory_maintainer.start()
 
     # 欢迎语
     print("="*70)
@@ -32,7 +40,10 @@ def main():
     print("  /feedback 路径 → 加载制作人反馈（示例：/feedback /root/xxx.json）；")
     print("  /optimize    → 优化芙宁娜的记忆；")
     print("  /reset_emotion → 重置芙宁娜情感值；")
+    print("  /emotion_stats → 查看情感判断/OOC检查的本地快速判断命中率；")
+    print("  /train_emotion → 从聊天记录训练情感词典；")
     print("  /summary [日期] → 手动总结聊天（示例：/summary 2025-10-01）；")
+    print("  /summary 开始..结束 → 查看日期范围内的聊天总结（示例：/summary 2025-10-01..2025-10-31）；")
     print("  /exit        → 退出程序（自动保存所有数据）。")
     print(f"❤️ 初始状态：芙宁娜情感值={furenna.emotion_value}，低阈值={EMOTION_VALUE_THRESHOLD}")
     print("="*70)
@@ -41,16 +52,24 @@ def main():
     while True:
         # 获取用户输入（旅行者）
         user_input = input("\n旅行者：").strip()
+        memory_maintainer.notify_activity()
+        # 芙宁娜还在说话时收到新消息：打断当前语音
+        if VOICE_BARGE_IN and user_input:
+            speak_finish.stop_speaking()
         
         # 退出指令：保存所有数据后退出
         if user_input.lower() == "exit":
             print("\n📌 程序退出中，正在保存所有数据...")
-            # 1. 优化记忆
-            memory_manager.optimize_all_memory()
+            # 1. 优化记忆（后台维护模式下不等待梳理，下次启动后在后台继续）
+            if MEMORY_BACKGROUND_MAINTENANCE:
+                memory_maintainer.stop()
+            else:
+                memory_manager.optimize_all_memory()
             # 2. 保存芙宁娜状态
             furenna._save_state()
-            # 3. 总结今日聊天
+            # 3. 总结今日聊天，写入缓冲中的聊天记录
             chat_logger.daily_summary()
+            chat_logger.close()
             print("✅ 记忆/状态/聊天总结已全部保存！")
             print("👋 再见啦～下次启动可直接恢复聊天状态～")
             break
@@ -86,29 +105,33 @@ def main():
             print(f"✅ 芙宁娜情感值已重置为初始值：{furenna.emotion_value}")
             continue
         
+        if user_input.startswith("/emotion_stats"):
+            lexicon = furenna.emotion_lexicon
+            print(f"📊 情感判断：词典{lexicon.stats['lexicon']}次，模型{lexicon.stats['model']}次，失败{lexicon.stats['failed']}次，快速判断命中率{lexicon.hit_rate():.0%}")
+            ooc_stats = furenna.ooc_guard.stats
+            print(f"📊 OOC检查：禁忌词直接判定{ooc_stats['banned']}次，风险打分{ooc_stats['scored']}次，抽样复查{ooc_stats['audited']}次，跳过打分{ooc_stats['skipped']}次，免打分比例{furenna.ooc_guard.skip_rate():.0%}")
+            continue
+        
+        if user_input.startswith("/train_emotion"):
+            chat_logger.flush()  # 训练前写入缓冲中的聊天记录
+            learned_count = furenna.emotion_lexicon.train_from_chat_logs(character_id=character_id)
+            print(f"✅ 情感词典训练完成：从聊天记录学到{learned_count}个词")
+            continue
+        
         if user_input.startswith("/summary"):
             # 解析总结日期
             parts = user_input.split(maxsplit=1)
             target_date = parts[1] if len(parts) > 1 else None
-            chat_logger.daily_summary(target_date)
+            if target_date and ".." in target_date:
+                start_date, end_date = (date.strip() for date in target_date.split("..", 1))
+                chat_logger.range_summary(start_date, end_date)
+            else:
+                chat_logger.daily_summary(target_date)
             continue
 
         # ========== 核心聊天流程 ==========
-        # 1. 先更新情感值（发消息即恢复，无暂停）
-        furenna._update_emotion_value(user_input)
-        # 2. 生成芙宁娜回复
-        furenna_reply = furenna.get_response(user_input)
-        # 3. 生成表情包（可选）
-        emoji_image = emoji_manager.get_emoji_image_by_text(furenna_reply, furenna.emotion_value)
-        emoji_tip = f"\n📸 匹配表情包：{emoji_image}" if emoji_image else ""
-        # 4. 生成语音（可选）
-        voice_result = speak_finish.process_voice_response(user_input, furenna_reply)
-        voice_tip = f"\n🎵 语音文件：{voice_result['voice_file']}" if voice_result['voice_file'] else ""
-        # 5. 输出回复
-        emotion_tip = f"\n❤️ 芙宁娜当前情感值：{furenna.emotion_value}"
-        print(f"\n芙宁娜：{furenna_reply}{emoji_tip}{voice_tip}{emotion_tip}")
-        # 6. 记录聊天（自动检查跨天总结）
-        chat_logger.log_chat(user_input, furenna_reply)
+        # 情感值更新‖锚点提取 → 回复 → 表情包‖语音‖记录，按依赖并发执行（输出顺序不变）
+        turn_pipeline.run_turn(user_input)
 
 if __name__ == "__main__":
     # 确保工作目录正确
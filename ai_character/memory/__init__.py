@@ -3,6 +3,18 @@
 from .core_memory import CoreMemory
 from .long_term_memory import LongTermMemory
 from .temporary_memory import TemporaryMemory
-from .memory_manager import MemoryManager
+from .memory_manager import MemoryManager, get_memory_manager
+from .anchor_index import AnchorIndex
+from .memory_journal import MemoryJournal
+from .sqlite_store import SQLiteMemoryStore
+from .memory_store import open_memory_store
+from .memory_maintainer import MemoryMaintainer
+from .group_merger import merge_groups_parallel
+from .memory_context import build_memory_context
+from .vector_index import VectorIndex, open_vector_index
 
-__all__ = ["CoreMemory", "LongTermMemory", "TemporaryMemory", "MemoryManager"]
\ No newline at end of file
+__all__ = [
+    "CoreMemory", "LongTermMemory", "TemporaryMemory", "MemoryManager", "get_memory_manager",
+    "AnchorIndex", "MemoryJournal", "SQLiteMemoryStore", "open_memory_store", "MemoryMaintainer",
+    "merge_groups_parallel", "build_memory_context", "VectorIndex", "open_vector_index"
+]
\ No newline at end of file
@@ -0,0 +1,132 @@
+# /root/ai_character/memory/anchor_index.py
+import hashlib
+import json
+import uuid
+
+def new_memory_id():
+    """生成记忆项唯一ID"""
+    return uuid.uuid4().hex
+
+def ensure_memory_id(item):
+    """兼容旧数据：缺少memory_id的记忆项补充ID"""
+    if "memory_id" not in item:
+        item["memory_id"] = new_memory_id()
+    return item["memory_id"]
+
+def group_by_anchor(items):
+    """按锚点词分组：{anchor: [item, ...]}（同一记忆项可出现在多个分组）"""
+    anchor_groups = {}
+    for item in items:
+        for anchor in item["anchor_words"]:
+            if anchor not in anchor_groups:
+                anchor_groups[anchor] = []
+            anchor_groups[anchor].append(item)
+    return anchor_groups
+
+def group_digest(items):
+    """锚点分组内容摘要（只看内容与锚点词，与顺序、访问次数无关），用于判断分组自上次梳理后是否变化"""
+    fingerprints = sorted(json.dumps([item["content"], item["anchor_words"]], ensure_ascii=False) for item in items)
+    return hashlib.sha1("\n".join(fingerprints).encode("utf-8")).hexdigest()
+
+class AnchorIndex:
+    """
+    锚点倒排索引（内存）：锚点词 → 记忆ID集合，检索只访问命中的倒排项
+    链接邻接表：锚点词 → {共现锚点词: 次数}，由记忆项的links累加
+    """
+    def __init__(self, items=None):
+        self.postings = {}       # {anchor: {memory_id, ...}}
+        self.adjacency = {}      # {anchor: {linked_anchor: count}}
+        self._items = {}         # {memory_id: item}
+        self._order = {}         # {memory_id: 序号}，保证检索结果与memory_data顺序一致
+        self._indexed = {}       # {memory_id: (索引键, 链接)}，记录入索引时的快照，删除时按快照撤销
+        self._next_order = 0
+        if items:
+            self.rebuild(items)
+
+    @staticmethod
+    def _index_keys(item):
+        """记忆项的索引键：自身锚点词 + 链接中出现的锚点词"""
+        keys = set(item.get("anchor_words", []))
+        for link in item.get("links", []):
+            keys.update(link)
+        return keys
+
+    def add(self, item):
+        """新增（或重新索引）一条记忆项，保留原有顺序"""
+        memory_id = ensure_memory_id(item)
+        if memory_id in self._indexed:
+            self.remove(item)
+        else:
+            self._order[memory_id] = self._next_order
+            self._next_order += 1
+        keys = self._index_keys(item)
+        links = [tuple(link) for link in item.get("links", []) if len(link) == 2]
+        for anchor in keys:
+            self.postings.setdefault(anchor, set()).add(memory_id)
+        for a, b in links:
+            neighbors_a = self.adjacency.setdefault(a, {})
+            neighbors_a[b] = neighbors_a.get(b, 0) + 1
+            neighbors_b = self.adjacency.setdefault(b, {})
+            neighbors_b[a] = neighbors_b.get(a, 0) + 1
+        self._items[memory_id] = item
+        self._indexed[memory_id] = (keys, links)
+
+    def remove(self, item, keep_order=True):
+        """从索引中撤销一条记忆项（keep_order=False时同时丢弃其顺序号）"""
+        memory_id = item.get("memory_id")
+        indexed = self._indexed.pop(memory_id, None)
+        if indexed is None:
+            return
+        keys, links = indexed
+        for anchor in keys:
+            ids = self.postings.get(anchor)
+            if ids is not None:
+                ids.discard(memory_id)
+                if not ids:
+                    del self.postings[anchor]
+        for a, b in links:
+            self._decrement_link(a, b)
+            self._decrement_link(b, a)
+        self._items.pop(memory_id, None)
+        if not keep_order:
+            self._order.pop(memory_id, None)
+
+    def discard(self, item):
+        """彻底删除一条记忆项"""
+        self.remove(item, keep_order=False)
+
+    def _decrement_link(self, a, b):
+        neighbors = self.adjacency.get(a)
+        if neighbors is None or b not in neighbors:
+            return
+        neighbors[b] -= 1
+        if neighbors[b] <= 0:
+            del neighbors[b]
+        if not neighbors:
+            del self.adjacency[a]
+
+    def rebuild(self, items):
+        """全量重建索引（加载/梳理后调用）"""
+        self.postings = {}
+        self.adjacency = {}
+        self._items = {}
+        self._order = {}
+        self._indexed = {}
+        self._next_order = 0
+        for item in items:
+            self.add(item)
+
+    def lookup(self, query_anchors):
+        """检索命中任一锚点词（含链接锚点）的记忆项，按原顺序返回"""
+        matched_ids = set()
+        for anchor in query_anchors:
+            matched_ids.update(self.postings.get(anchor, ()))
+        return [self._items[memory_id] for memory_id in sorted(matched_ids, key=self._order.__getitem__)]
+
+    def get(self, memory_id):
+        """按ID取记忆项（不存在返回None）"""
+        return self._items.get(memory_id)
+
+    def get_linked_anchors(self, anchor):
+        """获取与锚点词共现过的锚点词及次数"""
+        return dict(self.adjacency.get(anchor, {}))
\ No newline at end of file
@@ -1,38 +1,93 @@
 # /root/ai_character/memory/core_memory.py
 import os
+import threading
 from utils.file_operations import (
     save_to_json, load_from_json, get_today_date_str, get_date_diff_days,
     extract_anchor_words_via_model
 )
+from .anchor_index import AnchorIndex, ensure_memory_id, new_memory_id, group_by_anchor, group_digest
+from .memory_store import open_memory_store
+from .group_merger import merge_groups_parallel
+from .vector_index import open_vector_index
 from config import (
     MEMORY_BASE_PATH, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM,
-    MEMORY_COMB_DAYS
+    MEMORY_COMB_DAYS, MEMORY_FTS_FALLBACK_LIMIT, MEMORY_BACKGROUND_MAINTENANCE
 )
 
 class CoreMemory:
     """核心记忆（永久）：锚点词+链接关系+每3天梳理（移除冲突覆盖）"""
     def __init__(self, character_id="furenna"):
-        self.file_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_core_memory.json")
+        # 记忆存储（追加日志/SQLite，按配置选择；首次启动自动迁移旧版core_memory.json）
+        self.store = open_memory_store(character_id, "core")
         self.comb_record_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_core_comb_record.json")
-        self.memory_data = self._load_memory()
+        self._lock = threading.RLock()       # 保护memory_data/索引（梳理提交与新增/检索互斥）
+        self._comb_lock = threading.Lock()   # 同一时间只允许一次梳理
+        # 全部记忆+锚点倒排索引（链接邻接表）：SQLite存储用数据库索引检索，梳理等需要全量数据时才载入
+        self._memory_data = None
+        self._anchor_index = None
+        if not hasattr(self.store, "query_by_anchors"):
+            self._ensure_loaded()
+        # 向量索引（MEMORY_RETRIEVAL_MODE为vector/hybrid时启用，否则为None；同步需要全部记忆）
+        self.vector_index = open_vector_index(character_id, "core")
+        if self.vector_index is not None:
+            self.vector_index.sync(self.memory_data)
         self.comb_record = load_from_json(self.comb_record_path)  # 梳理记录：{"last_comb_date": "2025-10-01"}
-        self.check_need_comb()  # 初始化时检查是否需要梳理
+        self._dirty_anchors = set()          # 上次梳理后有新增/更新的锚点分组
+        if not MEMORY_BACKGROUND_MAINTENANCE:
+            self.check_need_comb()  # 未启用后台维护时，初始化时检查是否需要梳理
+
+    @property
+    def memory_data(self):
+        """全部核心记忆（SQLite存储首次访问时才载入）"""
+        self._ensure_loaded()
+        return self._memory_data
+
+    @memory_data.setter
+    def memory_data(self, memory_data):
+        self._memory_data = memory_data
+
+    @property
+    def anchor_index(self):
+        """内存锚点倒排索引（与memory_data一起载入）"""
+        self._ensure_loaded()
+        return self._anchor_index
+
+    def _ensure_loaded(self):
+        """载入全部记忆并建立内存锚点索引（已载入则跳过）"""
+        with self._lock:
+            if self._memory_data is None:
+                memory_data = self._load_memory()
+                self._anchor_index = AnchorIndex(memory_data)
+                self._memory_data = memory_data
 
     def _load_memory(self):
-        """加载核心记忆（结构：[{content, anchor_words, links, create_time, update_time}]）"""
-        memory = load_from_json(self.file_path)
-        # 兼容旧数据：补充锚点词/链接字段
+        """加载核心记忆（结构：[{memory_id, content, anchor_words, links, create_time, update_time}]）"""
+        memory = self.store.load_all()
         for item in memory:
-            if "anchor_words" not in item:
-                item["anchor_words"] = []
-            if "links" not in item:
-                item["links"] = []  # 链接的锚点词（如["用户", "生日"]链接到["日期"]）
-            if "create_time" not in item:
-                item["create_time"] = get_today_date_str()
-            if "update_time" not in item:
-                item["update_time"] = get_today_date_str()
+            self._fill_defaults(item)
         return memory
 
+    @staticmethod
+    def _fill_defaults(item):
+        """兼容旧数据：补充锚点词/链接字段"""
+        if "anchor_words" not in item:
+            item["anchor_words"] = []
+        if "links" not in item:
+            item["links"] = []  # 链接的锚点词（如["用户", "生日"]链接到["日期"]）
+        if "create_time" not in item:
+            item["create_time"] = get_today_date_str()
+        if "update_time" not in item:
+            item["update_time"] = get_today_date_str()
+        ensure_memory_id(item)
+        return item
+
+    def _get_items(self, memory_ids):
+        """按ID取记忆项（需持有self._lock）：已载入时取内存中的同一对象，否则从SQLite按需读取"""
+        if self._memory_data is not None:
+            items = [self._anchor_index.get(memory_id) for memory_id in memory_ids]
+            return [item for item in items if item is not None]
+        return [self._fill_defaults(item) for item in self.store.load_by_ids(memory_ids)]
+
     def add_core_memory(self, content, anchor_words=None):
         """添加核心记忆（自动提取锚点词+建立链接，移除冲突检测）"""
         # 提取锚点词
@@ -46,6 +101,7 @@ class CoreMemory:
                 links.append([anchor_words[i], anchor_words[j]])
         
         memory_item = {
+            "memory_id": new_memory_id(),
             "content": content,
             "anchor_words": anchor_words,
             "links": links,
@@ -53,24 +109,33 @@ class CoreMemory:
             "update_time": get_today_date_str(),
             "is_core": True
         }
-        self.memory_data.append(memory_item)
-        save_to_json(self.file_path, self.memory_data)
+        with self._lock:
+            # 尚未载入全部记忆时只写入存储（载入时会一并读到）
+            if self._memory_data is not None:
+                self._memory_data.append(memory_item)
+                self._anchor_index.add(memory_item)
+            if self.vector_index is not None:
+                self.vector_index.upsert(memory_item)
+            self.store.add(memory_item)
+            self._mark_dirty(memory_item)
         return memory_item
 
     def get_core_memory_by_anchor(self, query_anchors):
-        """通过锚点词检索核心记忆（全量匹配+链接拓展）"""
-        related_memory = []
-        # 1. 先匹配直接锚点词
-        for item in self.memory_data:
-            if any(anchor in item["anchor_words"] for anchor in query_anchors):
-                related_memory.append(item)
-                continue
-            # 2. 匹配链接的锚点词
-            for link in item["links"]:
-                if any(anchor in link for anchor in query_anchors):
-                    related_memory.append(item)
-                    break
-        # 去重（按content）
+        """通过锚点词检索核心记忆（倒排索引匹配锚点词+链接拓展）"""
+        with self._lock:
+            related_memory = self.anchor_index.lookup(query_anchors)
+        return self._unique_by_content(related_memory)
+
+    def query_core_memory_by_anchor(self, query_anchors):
+        """通过SQLite锚点词索引检索核心记忆（联表匹配锚点词/链接，只读取命中项）"""
+        memory_ids = self.store.query_by_anchors(query_anchors)
+        with self._lock:
+            related_memory = self._get_items(memory_ids)
+        return self._unique_by_content(related_memory)
+
+    @staticmethod
+    def _unique_by_content(related_memory):
+        """去重（按content）"""
         unique_memory = []
         seen_content = set()
         for item in related_memory:
@@ -79,46 +144,110 @@ class CoreMemory:
                 unique_memory.append(item)
         return unique_memory
 
+    def get_core_memory_by_vector(self, query_text):
+        """向量检索核心记忆（未启用向量索引时返回空），返回[(记忆, 相似度)]"""
+        if self.vector_index is None:
+            return []
+        matches = self.vector_index.search([query_text])[0]
+        with self._lock:
+            items = [(self.anchor_index.get(memory_id), score) for memory_id, score in matches]
+        return [(item, score) for item, score in items if item is not None]
+
+    def search_core_memory_by_text(self, text, limit=MEMORY_FTS_FALLBACK_LIMIT):
+        """全文检索核心记忆（仅SQLite存储支持，锚点未命中时兜底）"""
+        if not hasattr(self.store, "search_fulltext"):
+            return []
+        memory_ids = self.store.search_fulltext(text, limit)
+        with self._lock:
+            return self._get_items(memory_ids)
+
     def comb_memory(self):
-        """梳理核心记忆：合并重复锚点、优化链接、精简冗余内容"""
-        from utils.file_operations import extract_anchor_words_via_model
-        # 1. 按锚点词分组
-        anchor_groups = {}
-        for item in self.memory_data:
-            for anchor in item["anchor_words"]:
-                if anchor not in anchor_groups:
-                    anchor_groups[anchor] = []
-                anchor_groups[anchor].append(item)
-        
-        # 2. 合并同锚点的冗余内容
-        new_memory_data = []
+        """梳理核心记忆：合并重复锚点、优化链接、精简冗余内容（可在后台线程执行）"""
+        if not self._comb_lock.acquire(blocking=False):
+            print("ℹ️ 核心记忆正在梳理中，跳过本次梳理")
+            return
+        try:
+            # 1. 加锁取快照并分组（不阻塞新增记忆）
+            with self._lock:
+                plan = self._plan_comb()
+            # 2. 合并内容（模型调用，不持锁）
+            merged = self._merge_groups(plan["merge_groups"])
+            # 3. 加锁提交：以当前最新数据为准，保留梳理期间新增的记忆
+            with self._lock:
+                self._commit_comb(plan, merged)
+            print("核心记忆梳理完成！")
+        finally:
+            self._comb_lock.release()
+
+    def _plan_comb(self):
+        """梳理计划：按锚点词分组，只有上次梳理后有变化（脏）的多成员分组需要重新合并"""
+        anchor_groups = group_by_anchor(self.memory_data)
+        # 脏分组：本次运行中标记过，或内容摘要与上次梳理记录不一致（覆盖重启前的改动）
+        dirty_anchors = self._dirty_anchors
+        self._dirty_anchors = set()
+        recorded_digests = self.comb_record.get("group_digests", {})
+        groups = []
         for anchor, items in anchor_groups.items():
-            if len(items) <= 1:
-                new_memory_data.extend(items)
-                continue
-            # 合并内容（调用本地模型总结）
-            import subprocess
-            combine_prompt = f"""
+            need_merge = len(items) > 1 and (
+                anchor in dirty_anchors or group_digest(items) != recorded_digests.get(anchor)
+            )
+            groups.append({
+                "anchor": anchor,
+                "ids": [item["memory_id"] for item in items],
+                "fingerprints": [self._fingerprint(item) for item in items],
+                "need_merge": need_merge
+            })
+        merge_groups = [[item["content"] for item in items]
+                        for group, items in zip(groups, anchor_groups.values()) if group["need_merge"]]
+        print(f"ℹ️ 核心记忆梳理：{len(merge_groups)}/{sum(len(items) > 1 for items in anchor_groups.values())}个分组有变化需要重新合并")
+        return {
+            "snapshot_ids": {item["memory_id"] for item in self.memory_data},
+            "groups": groups,
+            "merge_groups": merge_groups
+        }
+
+    @staticmethod
+    def _fingerprint(item):
+        """记忆内容指纹（梳理期间内容被改动的分组放弃合并）"""
+        return (item["content"], tuple(item["anchor_words"]))
+
+    def _merge_groups(self, merge_groups):
+        """合并同锚点的冗余内容（分组并发合并），返回与分组顺序一致的[(内容, 锚点词) 或 None]"""
+        combine_prompts = [
+            f"""
             请合并以下核心记忆内容，保留所有关键信息，精简冗余：
-            {[item["content"] for item in items]}
+            {contents}
             """
-            result = subprocess.run(
-                [f"{MEMORY_MODEL_PATH}/infer", "--prompt", combine_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            combined_content = result.stdout.strip()
-            # 重新提取锚点词和链接
-            combined_anchors = extract_anchor_words_via_model(
-                combined_content, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM
-            )
+            for contents in merge_groups
+        ]
+        return merge_groups_parallel(combine_prompts)
+
+    def _commit_comb(self, plan, merged):
+        """提交梳理结果（需持有self._lock）：成员已被删除/修改的分组保留现状，快照之后新增的记忆原样保留"""
+        current = {item["memory_id"]: item for item in self.memory_data}
+        merged_results = iter(merged)
+        new_memory_data = []
+        for group in plan["groups"]:
+            if not group["need_merge"]:
+                # 单成员分组/未变化的分组原样保留
+                new_memory_data.extend(current[memory_id] for memory_id in group["ids"] if memory_id in current)
+                continue
+            merged_result = next(merged_results)
+            items = [current.get(memory_id) for memory_id in group["ids"]]
+            if merged_result is None or any(item is None for item in items) \
+                    or [self._fingerprint(item) for item in items] != group["fingerprints"]:
+                # 合并失败或梳理期间分组成员有变化，放弃本组合并，留到下次梳理
+                self._dirty_anchors.add(group["anchor"])
+                new_memory_data.extend(item for item in items if item is not None)
+                continue
+            combined_content, combined_anchors = merged_result
             combined_links = []
             for i in range(len(combined_anchors)):
                 for j in range(i+1, len(combined_anchors)):
                     combined_links.append([combined_anchors[i], combined_anchors[j]])
             # 生成合并后的记忆项
             combined_item = {
+                "memory_id": new_memory_id(),
                 "content": combined_content,
                 "anchor_words": combined_anchors,
                 "links": combined_links,
@@ -127,23 +256,41 @@ class CoreMemory:
                 "is_core": True
             }
             new_memory_data.append(combined_item)
-        
-        # 3. 去重后保存
-        self.memory_data = new_memory_data
-        save_to_json(self.file_path, self.memory_data)
-        # 4. 记录梳理日期
-        self.comb_record = {"last_comb_date": get_today_date_str()}
+        # 梳理期间新增的记忆
+        new_memory_data.extend(item for memory_id, item in current.items() if memory_id not in plan["snapshot_ids"])
+
+        # 去重后保存
+        self.store.replace_all(new_memory_data)
+        self.memory_data = self.store.load_all()
+        self.anchor_index.rebuild(self.memory_data)
+        if self.vector_index is not None:
+            self.vector_index.sync(self.memory_data)
+        # 记录梳理日期
+        self.comb_record = {"last_comb_date": get_today_date_str(), "group_digests": self._group_digests()}
         save_to_json(self.comb_record_path, self.comb_record)
-        print("核心记忆梳理完成！")
 
-    def check_need_comb(self):
-        """检查是否需要梳理（每3天一次）"""
+    def _group_digests(self):
+        """当前各锚点分组的内容摘要（仍为脏的分组不记录，下次梳理必定重新合并）"""
+        return {
+            anchor: group_digest(items) for anchor, items in group_by_anchor(self.memory_data).items()
+            if anchor not in self._dirty_anchors
+        }
+
+    def _mark_dirty(self, *items):
+        """标记记忆项所在的锚点分组为脏（需持有self._lock）"""
+        for item in items:
+            self._dirty_anchors.update(item["anchor_words"])
+
+    def need_comb(self):
+        """是否到了梳理时间（每3天一次，从未梳理过则立即梳理）"""
         last_comb_date = self.comb_record.get("last_comb_date", "")
         if not last_comb_date:
-            # 首次直接梳理
-            self.comb_memory()
-            return
+            return True
         # 计算距离上次梳理的天数
         diff_days = get_date_diff_days(last_comb_date, get_today_date_str())
-        if diff_days >= MEMORY_COMB_DAYS:
+        return diff_days >= MEMORY_COMB_DAYS
+
+    def check_need_comb(self):
+        """检查是否需要梳理（每3天一次）"""
+        if self.need_comb():
             self.comb_memory()
\ No newline at end of file
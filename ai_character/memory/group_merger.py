@@ -0,0 +1,59 @@
+# /root/ai_character/memory/group_merger.py
+from concurrent.futures import ThreadPoolExecutor
+from utils.inference_worker import infer, batch_infer
+from utils.file_operations import extract_anchor_words_via_model, extract_anchor_words_many
+from config import MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM, MEMORY_COMB_WORKERS, MEMORY_COMB_CHUNK_SIZE
+
+def _merge_chunk(prompts):
+    """合并一批分组：一次批量推理得到合并内容，再批量提取锚点词"""
+    combined_contents = [
+        output.strip() for output in batch_infer(f"{MEMORY_MODEL_PATH}/infer", prompts)
+    ]
+    if not all(combined_contents):
+        raise ValueError("模型返回了空的合并内容")
+    combined_anchors_list = extract_anchor_words_many(
+        combined_contents, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM
+    )
+    return list(zip(combined_contents, combined_anchors_list))
+
+def _merge_one(prompt):
+    """单独合并一个分组（批量失败后的逐组重试），失败返回None"""
+    try:
+        combined_content = infer(f"{MEMORY_MODEL_PATH}/infer", prompt).strip()
+        if not combined_content:
+            raise ValueError("模型返回了空的合并内容")
+        return combined_content, extract_anchor_words_via_model(
+            combined_content, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM
+        )
+    except Exception as e:
+        print(f"⚠️ 记忆分组合并失败：{e} → 本组保持原样，下次梳理重试")
+        return None
+
+def _merge_chunk_isolated(prompts):
+    """合并一批分组，整批失败时逐组重试，单个分组失败不影响其他分组"""
+    try:
+        return _merge_chunk(prompts)
+    except Exception as e:
+        print(f"⚠️ 记忆分组批量合并失败：{e} → 逐组重试")
+        return [_merge_one(prompt) for prompt in prompts]
+
+def merge_groups_parallel(prompts, max_workers=MEMORY_COMB_WORKERS, chunk_size=MEMORY_COMB_CHUNK_SIZE):
+    """
+    并发合并锚点分组：每chunk_size个分组为一个任务，最多max_workers个任务同时执行
+    返回与prompts顺序一致的列表，元素为(合并内容, 锚点词)，合并失败的分组为None
+    """
+    results = [None] * len(prompts)
+    if not prompts:
+        return results
+    chunk_size = max(1, chunk_size)
+    chunks = [list(range(start, min(start + chunk_size, len(prompts)))) for start in range(0, len(prompts), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="memory-comb") as executor:
+        futures = [
+            executor.submit(_merge_chunk_isolated, [prompts[index] for index in chunk])
+            for chunk in chunks
+        ]
+        # 按任务提交顺序收集结果，输出顺序与输入一致
+        for chunk, future in zip(chunks, futures):
+            for index, result in zip(chunk, future.result()):
+                results[index] = result
+    return results
\ No newline at end of file
@@ -0,0 +1,113 @@
+# /root/ai_character/memory/memory_context.py
+import math
+import re
+import time
+from config import MEMORY_CONTEXT_MAX_CHARS
+
+# 记忆层级基础分：核心记忆优先，其次长期记忆，临时记忆主要靠时效
+TIER_WEIGHTS = {"core": 1.5, "long_term": 1.0, "temporary": 0.8}
+# 时效半衰期（天）：临时记忆是近期聊天，几小时后就明显降权
+RECENCY_HALF_LIFE_DAYS = {"core": 30.0, "long_term": 7.0, "temporary": 0.25}
+# 锚点重合度/访问次数的权重
+ANCHOR_OVERLAP_WEIGHT = 2.0
+ACCESS_COUNT_WEIGHT = 0.3
+# 与已选记忆的字二元组Jaccard相似度达到该值视为重复
+DUPLICATE_SIMILARITY = 0.85
+# 每条记忆在提示词中的额外字数（「- 」前缀+换行缩进）
+ITEM_OVERHEAD_CHARS = 12
+TIER_TITLES = [("core", "核心记忆"), ("long_term", "长期记忆"), ("temporary", "近期聊天")]
+
+_NORMALIZE_PATTERN = re.compile(r"[\W_]+")
+
+def _parse_time(value):
+    """update_time/create_time（日期或日期时间）→ 时间戳，无法解析返回None"""
+    for time_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _bigrams(content):
+    text = _NORMALIZE_PATTERN.sub("", content.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+def _is_duplicate(grams, selected_grams):
+    for other in selected_grams:
+        if len(grams & other) / len(grams | other) >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+def score_memory(item, tier, input_anchors, now=None, similarity=None):
+    """记忆相关度 = 层级基础分 + 相关度（锚点重合度与向量相似度取较大值） + 时效 + 访问次数"""
+    now = now if now is not None else time.time()
+    if input_anchors:
+        anchor_words = item.get("anchor_words")
+        if anchor_words:
+            hits = len(set(anchor_words) & set(input_anchors))
+        else:
+            # 临时记忆没有锚点词：看内容中出现了多少输入锚点词
+            hits = sum(1 for anchor in input_anchors if anchor and anchor in item.get("content", ""))
+        overlap = hits / len(input_anchors)
+    else:
+        overlap = 0.0
+    if similarity:
+        overlap = max(overlap, similarity.get(item.get("memory_id"), 0.0))
+    timestamp = _parse_time(item.get("update_time") or item.get("create_time"))
+    age_days = max(0.0, (now - timestamp) / 86400) if timestamp is not None else 365.0
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS[tier])
+    access = math.log1p(item.get("access_count", 0))
+    return TIER_WEIGHTS[tier] + ANCHOR_OVERLAP_WEIGHT * overlap + recency + ACCESS_COUNT_WEIGHT * access
+
+def build_memory_context(related_memory, max_chars=MEMORY_CONTEXT_MAX_CHARS):
+    """
+    把检索到的记忆整理成提示词片段：按相关度从高到低选取，总字数不超过max_chars，近似重复的内容只保留一条
+    :param related_memory: retrieve_all_related_memory的返回值
+    :return: (记忆上下文文本, 统计{"candidates", "selected", "dropped", "duplicates", "chars"})
+    """
+    input_anchors = related_memory.get("input_anchors") or []
+    similarity = related_memory.get("similarity")
+    now = time.time()
+    candidates = []
+    for tier, _ in TIER_TITLES:
+        for position, item in enumerate(related_memory.get(tier, [])):
+            if item.get("content"):
+                score = score_memory(item, tier, input_anchors, now, similarity)
+                candidates.append((score, tier, position, item))
+    # 同分时：临时记忆越新越优先，核心/长期记忆按检索顺序
+    candidates.sort(
+        key=lambda candidate: (candidate[0], candidate[2] if candidate[1] == "temporary" else -candidate[2]),
+        reverse=True
+    )
+
+    selected = {tier: [] for tier, _ in TIER_TITLES}
+    selected_grams = []
+    used_chars = dropped = duplicates = 0
+    for _, tier, position, item in candidates:
+        content = item["content"]
+        grams = _bigrams(content)
+        if _is_duplicate(grams, selected_grams):
+            duplicates += 1
+            continue
+        cost = len(content) + ITEM_OVERHEAD_CHARS
+        if used_chars + cost > max_chars:
+            # 放不下的跳过，后面更短的记忆可能还能放下
+            dropped += 1
+            continue
+        used_chars += cost
+        selected_grams.append(grams)
+        selected[tier].append((position, content))
+
+    lines = []
+    for tier, title in TIER_TITLES:
+        # 近期聊天按时间顺序排列，核心/长期记忆保持检索顺序
+        contents = [content for _, content in sorted(selected[tier])]
+        lines.append(f"{title}：" + "".join(f"\n        - {content}" for content in contents) if contents else f"{title}：无")
+    report = {
+        "candidates": len(candidates),
+        "selected": sum(len(items) for items in selected.values()),
+        "dropped": dropped,
+        "duplicates": duplicates,
+        "chars": used_chars,
+    }
+    return "\n        ".join(lines), report
\ No newline at end of file
@@ -0,0 +1,144 @@
+# /root/ai_character/memory/memory_journal.py
+import json
+import os
+import threading
+from config import MEMORY_JOURNAL_COMPACT_THRESHOLD
+from .anchor_index import ensure_memory_id
+
+class MemoryJournal:
+    """
+    追加式记忆存储：JSONL日志逐行记录add/update/delete，内存中维护物化视图
+    日志中的过期记录（被更新/删除覆盖的旧记录）超过阈值时自动压缩重写
+    记录格式：
+      {"op": "add", "item": {...}}
+      {"op": "update", "id": "...", "fields": {...}}   # 只记录变化的字段
+      {"op": "delete", "ids": ["...", ...]}
+    """
+    def __init__(self, journal_path, legacy_json_path=None, compact_threshold=MEMORY_JOURNAL_COMPACT_THRESHOLD):
+        self.journal_path = journal_path
+        self.legacy_json_path = legacy_json_path
+        self.compact_threshold = compact_threshold
+        self._items = {}          # 物化视图：{memory_id: item}（保持插入顺序）
+        self._record_count = 0    # 日志中的记录行数
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        if os.path.exists(journal_path):
+            self._replay()
+        elif legacy_json_path and os.path.exists(legacy_json_path):
+            self._migrate_legacy_json()
+
+    def _replay(self):
+        """回放日志，重建物化视图（跳过写了一半的损坏行）"""
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ 跳过损坏的记忆日志行：{self.journal_path}")
+                    continue
+                self._apply(record)
+                self._record_count += 1
+
+    def _apply(self, record):
+        """把一条记录应用到物化视图"""
+        op = record.get("op")
+        if op == "add":
+            item = record["item"]
+            self._items[item["memory_id"]] = item
+        elif op == "update":
+            item = self._items.get(record["id"])
+            if item is not None:
+                item.update(record["fields"])
+        elif op == "delete":
+            for memory_id in record["ids"]:
+                self._items.pop(memory_id, None)
+
+    def _migrate_legacy_json(self):
+        """从旧版*_memory.json迁移：补充ID、去掉旧save_to_json追加产生的重复项，写成压缩后的日志"""
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                legacy_items = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 读取旧记忆文件失败：{e} → 从空记忆开始")
+            return
+        legacy_items = [item for item in legacy_items if isinstance(item, dict)] if isinstance(legacy_items, list) else []
+        # 旧save_to_json每次保存都会把整个列表再追加一遍，两次保存之间links/update_time/anchor_words可能被修改，
+        # 所以同一条记忆的各个副本不完全相同：按(content, create_time)识别同一条记忆，只保留最后一份（越靠后越新）
+        last_index = {}
+        for index, item in enumerate(legacy_items):
+            last_index[self._legacy_key(item)] = index
+        for index, item in enumerate(legacy_items):
+            if last_index[self._legacy_key(item)] == index:
+                self._items[ensure_memory_id(item)] = item
+        duplicate_count = len(legacy_items) - len(self._items)
+        if duplicate_count:
+            print(f"ℹ️ 旧记忆文件中去掉了{duplicate_count}条重复项")
+        self.compact()
+        os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+        print(f"✅ 旧记忆文件已迁移为追加日志：{self.legacy_json_path} → {self.journal_path}")
+
+    @staticmethod
+    def _legacy_key(item):
+        """旧记忆项的去重键：有ID按ID，无ID按(内容, 创建时间)"""
+        if "memory_id" in item:
+            return ("id", item["memory_id"])
+        return ("content", item.get("content"), item.get("create_time"))
+
+    def _append(self, record):
+        """追加一条记录（一行JSON），必要时触发压缩"""
+        with self._lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._record_count += 1
+            if self._record_count - len(self._items) > self.compact_threshold:
+                self.compact()
+
+    def load_all(self):
+        """返回物化视图中的全部记忆项（按写入顺序）"""
+        with self._lock:
+            return list(self._items.values())
+
+    def add(self, item):
+        """新增记忆项"""
+        with self._lock:
+            self._items[ensure_memory_id(item)] = item
+            self._append({"op": "add", "item": item})
+
+    def update(self, item, fields=None):
+        """更新记忆项：fields为变化的字段名列表，缺省时记录整条记忆"""
+        with self._lock:
+            memory_id = ensure_memory_id(item)
+            self._items[memory_id] = item
+            keys = fields if fields is not None else [key for key in item if key != "memory_id"]
+            self._append({"op": "update", "id": memory_id, "fields": {key: item[key] for key in keys}})
+
+    def delete_many(self, memory_ids):
+        """删除多条记忆项（合并为一条记录）"""
+        with self._lock:
+            memory_ids = [memory_id for memory_id in memory_ids if memory_id in self._items]
+            if not memory_ids:
+                return
+            for memory_id in memory_ids:
+                self._items.pop(memory_id, None)
+            self._append({"op": "delete", "ids": memory_ids})
+
+    def replace_all(self, items):
+        """整体替换全部记忆（梳理后调用），直接重写为压缩后的日志"""
+        with self._lock:
+            self._items = {ensure_memory_id(item): item for item in items}
+            self.compact()
+
+    def compact(self):
+        """压缩：把物化视图写成只含add记录的新日志，原子替换旧日志"""
+        with self._lock:
+            tmp_path = f"{self.journal_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item in self._items.values():
+                    f.write(json.dumps({"op": "add", "item": item}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+            self._record_count = len(self._items)
\ No newline at end of file
@@ -0,0 +1,84 @@
+# /root/ai_character/memory/memory_maintainer.py
+import threading
+import time
+from config import MEMORY_MAINTENANCE_INTERVAL, MEMORY_MAINTENANCE_IDLE_SECONDS
+
+class MemoryMaintainer:
+    """
+    后台记忆维护线程：启动后、用户空闲时、定时执行记忆梳理/过期清理/跨天总结检查
+    梳理的模型调用在后台进行，只在提交结果时短暂加锁，聊天过程中新增的记忆不会丢失
+    """
+    def __init__(self, memory_manager, chat_logger=None,
+                 interval=MEMORY_MAINTENANCE_INTERVAL, idle_seconds=MEMORY_MAINTENANCE_IDLE_SECONDS):
+        self.memory_manager = memory_manager
+        self.chat_logger = chat_logger
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_activity = time.monotonic()
+        self._last_run = None            # 上次维护时间（None表示启动后尚未维护）
+        self._ran_since_activity = False  # 本次空闲期间是否已维护过
+
+    def start(self):
+        """启动后台维护线程（守护线程，退出程序时不等待）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-maintainer", daemon=True)
+        self._thread.start()
+
+    def notify_activity(self):
+        """用户有输入时调用：重新开始计算空闲时间"""
+        self._last_activity = time.monotonic()
+        self._ran_since_activity = False
+
+    def _seconds_until_due(self):
+        """距离下次维护的秒数（<=0表示应立即维护）"""
+        if self._last_run is None:
+            return 0
+        now = time.monotonic()
+        wait = self.interval - (now - self._last_run)
+        if not self._ran_since_activity:
+            wait = min(wait, self.idle_seconds - (now - self._last_activity))
+        return wait
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            wait = self._seconds_until_due()
+            if wait > 0:
+                self._stop_event.wait(min(wait, self.idle_seconds))
+                continue
+            self.run_once()
+
+    def run_once(self):
+        """执行一次维护（单项失败不影响其他项）"""
+        self._last_run = time.monotonic()
+        self._ran_since_activity = True
+        for name, get_tier in (("核心", lambda: self.memory_manager.core_memory),
+                               ("长期", lambda: self.memory_manager.long_memory)):
+            if self._stop_event.is_set():
+                return
+            try:
+                get_tier().check_need_comb()
+            except Exception as e:
+                print(f"⚠️ 后台梳理{name}记忆失败：{e}")
+        try:
+            self.memory_manager.temp_memory._clean_expired_memory()
+        except Exception as e:
+            print(f"⚠️ 后台清理临时记忆失败：{e}")
+        if self.chat_logger is not None:
+            try:
+                self.chat_logger._check_date()
+            except Exception as e:
+                print(f"⚠️ 后台跨天总结检查失败：{e}")
+
+    def stop(self):
+        """停止后台维护：不等待进行中的梳理（模型调用），只等待正在提交的结果写完"""
+        self._stop_event.set()
+        if self._thread is None or not self._thread.is_alive():
+            return
+        for tier in (self.memory_manager._core_memory, self.memory_manager._long_memory):
+            if tier is not None:
+                with tier._lock:
+                    pass
\ No newline at end of file
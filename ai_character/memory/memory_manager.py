@@ -1,43 +1,105 @@
 # /root/ai_character/memory/memory_manager.py
 import os
+import threading
 from .core_memory import CoreMemory
 from .long_term_memory import LongTermMemory
 from .temporary_memory import TemporaryMemory
 from utils.file_operations import extract_anchor_words_via_model
-from config import MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM, ACTIVE_TOPIC_MEMORY_TYPES
+from config import (
+    MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM, ACTIVE_TOPIC_MEMORY_TYPES, MEMORY_CONTEXT_TEMP_WINDOW,
+    MEMORY_RETRIEVAL_MODE, MEMORY_STORAGE_BACKEND
+)
 
 class MemoryManager:
     """记忆总管理器：锚点检索、全量读取、自动梳理、主动话题素材（移除冲突覆盖）"""
     def __init__(self, character_id="furenna"):
-        self.core_memory = CoreMemory(character_id)
-        self.long_memory = LongTermMemory(character_id)
-        self.temp_memory = TemporaryMemory(character_id)
         self.character_id = character_id
+        # 各层记忆首次访问时才加载
+        self._core_memory = None
+        self._long_memory = None
+        self._temp_memory = None
+        self._load_lock = threading.RLock()
 
-    def retrieve_all_related_memory(self, input_text):
+    @property
+    def core_memory(self):
+        with self._load_lock:
+            if self._core_memory is None:
+                self._core_memory = CoreMemory(self.character_id)
+            return self._core_memory
+
+    @property
+    def long_memory(self):
+        with self._load_lock:
+            if self._long_memory is None:
+                self._long_memory = LongTermMemory(self.character_id)
+            return self._long_memory
+
+    @property
+    def temp_memory(self):
+        with self._load_lock:
+            if self._temp_memory is None:
+                self._temp_memory = TemporaryMemory(self.character_id)
+            return self._temp_memory
+
+    def uses_vector_only(self):
+        """是否只用向量检索（此时查询不再调用锚点词提取模型）"""
+        return MEMORY_RETRIEVAL_MODE == "vector" and self.core_memory.vector_index is not None
+
+    def extract_input_anchors(self, input_text):
+        """提取输入文本的锚点词（只用向量检索时不调用模型，返回空列表）"""
+        if self.uses_vector_only():
+            return []
+        return extract_anchor_words_via_model(input_text, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM)
+
+    def retrieve_all_related_memory(self, input_text, input_anchors=None):
         """
         全量检索所有相关记忆（核心+长期+临时）
-        步骤：1. 提取输入锚点词；2. 锚点检索核心/长期记忆；3. 全量取临时记忆
+        步骤：1. 提取输入锚点词（已提前提取则直接使用）；2. 锚点/向量检索核心/长期记忆；3. 取最近的临时记忆
+        MEMORY_RETRIEVAL_MODE：anchor（锚点）/ vector（向量）/ hybrid（两者合并去重）
         """
         # 1. 提取输入的锚点词
-        input_anchors = extract_anchor_words_via_model(
-            input_text, MEMORY_MODEL_PATH, ANCHOR_WORD_MAX_NUM
-        )
+        if input_anchors is None:
+            input_anchors = self.extract_input_anchors(input_text)
         print(f"输入文本锚点词：{input_anchors}")
         
-        # 2. 检索核心记忆（全量匹配锚点）
-        core_related = self.core_memory.get_core_memory_by_anchor(input_anchors)
-        # 3. 检索长期记忆（全量匹配锚点）
-        long_related = self.long_memory.get_long_memory_by_anchor(input_anchors)
-        # 4. 获取所有临时记忆
-        temp_related = self.temp_memory.get_all_temp_memory()
+        core_related, long_related = [], []
+        similarity = {}  # 向量检索命中的相似度 {memory_id: 相似度}
+        if not self.uses_vector_only():
+            if MEMORY_STORAGE_BACKEND == "sqlite":
+                # 2/3. SQLite存储：锚点词/链接索引联表检索核心/长期记忆，只读取命中项
+                core_related = self.core_memory.query_core_memory_by_anchor(input_anchors)
+                long_related = self.long_memory.query_long_memory_by_anchor(input_anchors)
+            else:
+                # 2. 检索核心记忆（全量匹配锚点）
+                core_related = self.core_memory.get_core_memory_by_anchor(input_anchors)
+                # 3. 检索长期记忆（全量匹配锚点）
+                long_related = self.long_memory.get_long_memory_by_anchor(input_anchors)
+        if MEMORY_RETRIEVAL_MODE in ("vector", "hybrid"):
+            # 向量检索（能命中换了说法的记忆），与锚点结果合并去重
+            for related, matches in (
+                (core_related, self.core_memory.get_core_memory_by_vector(input_text)),
+                (long_related, self.long_memory.get_long_memory_by_vector(input_text)),
+            ):
+                seen_ids = {item["memory_id"] for item in related}
+                for item, score in matches:
+                    similarity[item["memory_id"]] = score
+                    if item["memory_id"] not in seen_ids:
+                        seen_ids.add(item["memory_id"])
+                        related.append(item)
+        # 未命中任何核心/长期记忆时，用全文检索兜底（SQLite存储）
+        if not core_related and not long_related:
+            core_related = self.core_memory.search_core_memory_by_text(input_text)
+            long_related = self.long_memory.search_long_memory_by_text(input_text)
+        # 4. 获取最近的临时记忆（更早的近期聊天不会进入回复上下文）
+        temp_related = self.temp_memory.get_recent_temp_memory(MEMORY_CONTEXT_TEMP_WINDOW)
         
         # 整合记忆（保留全量，便于后续检索）
         all_related_memory = {
             "core": core_related,
             "long_term": long_related,
             "temporary": temp_related,
-            "input_anchors": input_anchors  # 记录输入锚点词
+            "input_anchors": input_anchors,  # 记录输入锚点词
+            "similarity": similarity
         }
         return all_related_memory
 
@@ -75,4 +137,17 @@ class MemoryManager:
         self.core_memory.comb_memory()
         self.long_memory.comb_memory()
         self.temp_memory._clean_expired_memory()
-        print("所有记忆优化完成！")
\ No newline at end of file
+        print("所有记忆优化完成！")
+
+# 记忆管理器注册表：每个角色只有一个共享实例，所有模块看到同一份内存状态
+_memory_managers = {}
+_memory_managers_lock = threading.Lock()
+
+def get_memory_manager(character_id="furenna"):
+    """获取角色共享的记忆管理器（首次调用时创建）"""
+    with _memory_managers_lock:
+        manager = _memory_managers.get(character_id)
+        if manager is None:
+            manager = MemoryManager(character_id)
+            _memory_managers[character_id] = manager
+        return manager
\ No newline at end of file
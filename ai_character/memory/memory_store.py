@@ -0,0 +1,24 @@
+# /root/ai_character/memory/memory_store.py
+import os
+from config import MEMORY_BASE_PATH, MEMORY_STORAGE_BACKEND
+from .memory_journal import MemoryJournal
+
+def open_memory_store(character_id, tier):
+    """
+    按配置打开记忆存储（tier：core/long/temp）
+    journal：追加日志（默认）；sqlite：SQLite+FTS5（首次启用时自动导入原有日志/旧JSON）
+    """
+    journal_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_{tier}_memory.jsonl")
+    legacy_json_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_{tier}_memory.json")
+    if MEMORY_STORAGE_BACKEND == "sqlite":
+        from .sqlite_store import SQLiteMemoryStore
+        db_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_memory.db")
+        import_from = None
+        if os.path.exists(journal_path) or os.path.exists(legacy_json_path):
+            import_from = MemoryJournal(journal_path, legacy_json_path=legacy_json_path)
+        store = SQLiteMemoryStore(db_path, tier, import_from=import_from)
+        if store.imported_count and os.path.exists(journal_path):
+            # 已导入SQLite，原日志改名保留，避免两份数据并存
+            os.replace(journal_path, f"{journal_path}.migrated")
+        return store
+    return MemoryJournal(journal_path, legacy_json_path=legacy_json_path)
\ No newline at end of file
@@ -0,0 +1,313 @@
+# /root/ai_character/memory/sqlite_store.py
+import json
+import os
+import sqlite3
+import threading
+from .anchor_index import ensure_memory_id
+
+# 单独成列的字段，其余字段（is_core/chat_context等）存入extra JSON
+_COLUMN_FIELDS = ("memory_id", "content", "create_time", "update_time", "expire_date", "access_count")
+# 只改这些字段时直接UPDATE列，无需重写锚点/链接/全文索引
+_SIMPLE_UPDATE_FIELDS = ("create_time", "update_time", "expire_date", "access_count")
+# 按ID批量读取时每条SQL的ID个数（旧版SQLite单条语句最多999个参数）
+_ID_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_items (
+    memory_id TEXT PRIMARY KEY,
+    tier TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    create_time TEXT,
+    update_time TEXT,
+    expire_date TEXT,
+    access_count INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS memory_anchors (
+    memory_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    anchor TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memory_links (
+    memory_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    anchor_a TEXT NOT NULL,
+    anchor_b TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_tier_seq ON memory_items(tier, seq);
+CREATE INDEX IF NOT EXISTS idx_items_tier_expire ON memory_items(tier, expire_date);
+CREATE INDEX IF NOT EXISTS idx_items_tier_create ON memory_items(tier, create_time);
+CREATE INDEX IF NOT EXISTS idx_anchors_anchor ON memory_anchors(anchor);
+CREATE INDEX IF NOT EXISTS idx_anchors_memory ON memory_anchors(memory_id);
+CREATE INDEX IF NOT EXISTS idx_links_a ON memory_links(anchor_a);
+CREATE INDEX IF NOT EXISTS idx_links_b ON memory_links(anchor_b);
+CREATE INDEX IF NOT EXISTS idx_links_memory ON memory_links(memory_id);
+"""
+
+class SQLiteMemoryStore:
+    """
+    SQLite记忆存储（可选后端，接口与MemoryJournal一致）：
+    记忆项/锚点词/链接分表存储，content建FTS5全文索引，WAL模式下读写互不阻塞
+    锚点检索直接走锚点词/链接索引联表查询，命中项再按ID读取，无需启动时把整层记忆载入内存
+    同一角色的核心/长期/临时记忆共用一个数据库，按tier区分
+    """
+    def __init__(self, db_path, tier, import_from=None):
+        self.db_path = db_path
+        self.tier = tier
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            self._fts_tokenizer = self._create_fts_table()
+            self._conn.commit()
+        self._next_seq = self._load_next_seq()
+        self.imported_count = 0  # 首次启用时从原有存储导入的条数
+        if import_from is not None and self._count() == 0:
+            self._import_items(import_from)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _read_conn(self):
+        """每个线程独立的只读连接（WAL下并发读不阻塞写）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _create_fts_table(self):
+        """创建全文索引：优先trigram分词（中文按子串匹配），旧版SQLite退回unicode61"""
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5("
+                    f"content, memory_id UNINDEXED, tier UNINDEXED, tokenize='{tokenizer}')"
+                )
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        print("⚠️ 当前SQLite不支持FTS5，全文检索不可用")
+        return None
+
+    def _load_next_seq(self):
+        row = self._conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM memory_items").fetchone()
+        return row[0]
+
+    def _count(self):
+        row = self._conn.execute("SELECT COUNT(*) FROM memory_items WHERE tier = ?", (self.tier,)).fetchone()
+        return row[0]
+
+    def _import_items(self, source_store):
+        """首次启用SQLite时，从原有存储（追加日志/旧JSON）导入"""
+        items = source_store.load_all()
+        if not items:
+            return
+        self.replace_all(items)
+        self.imported_count = len(items)
+        print(f"✅ 已将{len(items)}条{self.tier}记忆导入SQLite：{self.db_path}")
+
+    # ---------- 行 <-> 记忆项 ----------
+    def _write_item(self, item, seq):
+        """写入一条记忆项（含锚点/链接/全文索引），调用方负责加锁和提交"""
+        memory_id = ensure_memory_id(item)
+        extra = {key: value for key, value in item.items()
+                 if key not in _COLUMN_FIELDS and key not in ("anchor_words", "links")}
+        self._delete_rows([memory_id])
+        cursor = self._conn.execute(
+            "INSERT INTO memory_items (memory_id, tier, seq, content, create_time, update_time, "
+            "expire_date, access_count, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (memory_id, self.tier, seq, item.get("content", ""), item.get("create_time"),
+             item.get("update_time"), item.get("expire_date"), item.get("access_count"),
+             json.dumps(extra, ensure_ascii=False))
+        )
+        self._conn.executemany(
+            "INSERT INTO memory_anchors (memory_id, position, anchor) VALUES (?, ?, ?)",
+            [(memory_id, position, anchor) for position, anchor in enumerate(item.get("anchor_words", []))]
+        )
+        self._conn.executemany(
+            "INSERT INTO memory_links (memory_id, position, anchor_a, anchor_b) VALUES (?, ?, ?, ?)",
+            [(memory_id, position, link[0], link[1])
+             for position, link in enumerate(item.get("links", [])) if len(link) == 2]
+        )
+        if self._fts_tokenizer:
+            # 全文索引行与记忆行共用rowid，删除时可直接按rowid定位
+            self._conn.execute(
+                "INSERT INTO memory_fts (rowid, content, memory_id, tier) VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, item.get("content", ""), memory_id, self.tier)
+            )
+
+    def _delete_rows(self, memory_ids):
+        for memory_id in memory_ids:
+            row = self._conn.execute("SELECT rowid FROM memory_items WHERE memory_id = ?", (memory_id,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM memory_anchors WHERE memory_id = ?", (memory_id,))
+            self._conn.execute("DELETE FROM memory_links WHERE memory_id = ?", (memory_id,))
+            if self._fts_tokenizer:
+                self._conn.execute("DELETE FROM memory_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM memory_items WHERE rowid = ?", (row[0],))
+
+    def _row_to_item(self, row, anchors, links):
+        memory_id, content, create_time, update_time, expire_date, access_count, extra = row
+        item = {"memory_id": memory_id, "content": content}
+        if anchors is not None:
+            item["anchor_words"] = anchors
+            item["links"] = links
+        for key, value in (("create_time", create_time), ("update_time", update_time),
+                           ("expire_date", expire_date), ("access_count", access_count)):
+            if value is not None:
+                item[key] = value
+        item.update(json.loads(extra) if extra else {})
+        return item
+
+    def _fetch_items(self, conn, condition, params):
+        """读取满足条件（memory_items别名i上的WHERE条件）的记忆项及其锚点词/链接，按写入顺序"""
+        rows = conn.execute(
+            "SELECT i.memory_id, i.content, i.create_time, i.update_time, i.expire_date, i.access_count, i.extra "
+            f"FROM memory_items i WHERE {condition} ORDER BY i.seq", params
+        ).fetchall()
+        anchors, links = {}, {}
+        for memory_id, anchor in conn.execute(
+            "SELECT a.memory_id, a.anchor FROM memory_anchors a JOIN memory_items i "
+            f"ON a.memory_id = i.memory_id WHERE {condition} ORDER BY a.memory_id, a.position", params
+        ):
+            anchors.setdefault(memory_id, []).append(anchor)
+        for memory_id, anchor_a, anchor_b in conn.execute(
+            "SELECT l.memory_id, l.anchor_a, l.anchor_b FROM memory_links l JOIN memory_items i "
+            f"ON l.memory_id = i.memory_id WHERE {condition} ORDER BY l.memory_id, l.position", params
+        ):
+            links.setdefault(memory_id, []).append([anchor_a, anchor_b])
+        has_anchors = self.tier != "temp"
+        return [
+            self._row_to_item(
+                row,
+                anchors.get(row[0], []) if has_anchors else None,
+                links.get(row[0], []) if has_anchors else None
+            )
+            for row in rows
+        ]
+
+    # ---------- 与MemoryJournal一致的接口 ----------
+    def load_all(self):
+        """按写入顺序读取本层全部记忆项"""
+        with self._lock:
+            return self._fetch_items(self._conn, "i.tier = ?", (self.tier,))
+
+    def add(self, item):
+        with self._lock:
+            self._write_item(item, self._next_seq)
+            self._next_seq += 1
+            self._conn.commit()
+
+    def update(self, item, fields=None):
+        with self._lock:
+            memory_id = ensure_memory_id(item)
+            if fields is not None and all(field in _SIMPLE_UPDATE_FIELDS for field in fields):
+                assignments = ", ".join(f"{field} = ?" for field in fields)
+                self._conn.execute(
+                    f"UPDATE memory_items SET {assignments} WHERE memory_id = ?",
+                    [item.get(field) for field in fields] + [memory_id]
+                )
+            else:
+                row = self._conn.execute("SELECT seq FROM memory_items WHERE memory_id = ?", (memory_id,)).fetchone()
+                seq = row[0] if row else self._next_seq
+                if row is None:
+                    self._next_seq += 1
+                self._write_item(item, seq)
+            self._conn.commit()
+
+    def delete_many(self, memory_ids):
+        memory_ids = list(memory_ids)
+        if not memory_ids:
+            return
+        with self._lock:
+            self._delete_rows(memory_ids)
+            self._conn.commit()
+
+    def replace_all(self, items):
+        with self._lock:
+            # 整层批量删除后重写
+            tier_ids = "SELECT memory_id FROM memory_items WHERE tier = ?"
+            self._conn.execute(f"DELETE FROM memory_anchors WHERE memory_id IN ({tier_ids})", (self.tier,))
+            self._conn.execute(f"DELETE FROM memory_links WHERE memory_id IN ({tier_ids})", (self.tier,))
+            if self._fts_tokenizer:
+                self._conn.execute(
+                    "DELETE FROM memory_fts WHERE rowid IN (SELECT rowid FROM memory_items WHERE tier = ?)", (self.tier,)
+                )
+            self._conn.execute("DELETE FROM memory_items WHERE tier = ?", (self.tier,))
+            written = set()
+            for item in items:
+                memory_id = ensure_memory_id(item)
+                if memory_id in written:
+                    continue
+                written.add(memory_id)
+                self._write_item(item, self._next_seq)
+                self._next_seq += 1
+            self._conn.commit()
+
+    def compact(self):
+        """WAL检查点（SQLite无需追加日志式压缩）"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # ---------- 锚点/全文检索 ----------
+    def query_by_anchors(self, query_anchors):
+        """锚点词索引联表检索：命中自身锚点或链接锚点的记忆ID（按写入顺序）"""
+        query_anchors = list(query_anchors)
+        if not query_anchors:
+            return []
+        placeholders = ", ".join("?" for _ in query_anchors)
+        sql = (
+            "SELECT i.memory_id FROM memory_items i WHERE i.tier = ? AND i.memory_id IN ("
+            f"SELECT memory_id FROM memory_anchors WHERE anchor IN ({placeholders}) "
+            f"UNION SELECT memory_id FROM memory_links WHERE anchor_a IN ({placeholders}) "
+            f"UNION SELECT memory_id FROM memory_links WHERE anchor_b IN ({placeholders})"
+            ") ORDER BY i.seq"
+        )
+        params = [self.tier] + query_anchors * 3
+        return [row[0] for row in self._read_conn().execute(sql, params)]
+
+    def load_by_ids(self, memory_ids):
+        """按ID读取记忆项（含锚点词/链接），按传入ID的顺序返回，不存在的ID跳过"""
+        memory_ids = list(memory_ids)
+        found = {}
+        for start in range(0, len(memory_ids), _ID_BATCH_SIZE):
+            batch = memory_ids[start:start + _ID_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            for item in self._fetch_items(
+                self._read_conn(), f"i.tier = ? AND i.memory_id IN ({placeholders})", [self.tier] + batch
+            ):
+                found[item["memory_id"]] = item
+        return [found[memory_id] for memory_id in memory_ids if memory_id in found]
+
+    def _build_fts_query(self, text):
+        """构建全文检索表达式：trigram按3字子串OR匹配，unicode61按词OR匹配"""
+        if self._fts_tokenizer == "trigram":
+            terms = {text[i:i + 3] for i in range(len(text) - 2) if not any(c.isspace() for c in text[i:i + 3])}
+        else:
+            terms = set(text.split())
+        terms = sorted(terms)[:64]
+        return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    def search_fulltext(self, text, limit=5):
+        """全文检索（按bm25相关度），返回记忆ID列表"""
+        if not self._fts_tokenizer:
+            return []
+        fts_query = self._build_fts_query(text)
+        if not fts_query:
+            return []
+        try:
+            return [row[0] for row in self._read_conn().execute(
+                "SELECT memory_id FROM memory_fts WHERE memory_fts MATCH ? AND tier = ? "
+                "ORDER BY bm25(memory_fts) LIMIT ?", (fts_query, self.tier, limit)
+            )]
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ 全文检索失败：{e}")
+            return []
\ No newline at end of file
@@ -1,46 +1,94 @@
 # /root/ai_character/memory/temporary_memory.py
-import os
-from datetime import datetime, timedelta
-from utils.file_operations import save_to_json, load_from_json, get_today_date_str
-from config import MEMORY_BASE_PATH, TEMP_MEMORY_EXPIRE_DAYS
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from config import TEMP_MEMORY_EXPIRE_DAYS, TEMP_MEMORY_MAX_ENTRIES
+from .anchor_index import ensure_memory_id, new_memory_id
+from .memory_store import open_memory_store
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _parse_timestamp(create_time):
+    """create_time → 时间戳（格式异常返回None，按已过期处理）"""
+    try:
+        return time.mktime(time.strptime(create_time, TIME_FORMAT))
+    except (TypeError, ValueError):
+        return None
 
 class TemporaryMemory:
-    """临时记忆（数天）：无锚点，仅存储近期聊天内容"""
+    """
+    临时记忆（数天）：无锚点，仅存储近期聊天内容
+    内存中按创建时间排序的双端队列+缓存的时间戳：过期清理只从队头弹出，读取不做任何文件读写
+    新增只向存储追加一条记录；超过TEMP_MEMORY_MAX_ENTRIES时同样从队头淘汰最旧的
+    """
     def __init__(self, character_id="furenna"):
-        self.file_path = os.path.join(MEMORY_BASE_PATH, f"{character_id}_temp_memory.json")
-        self.memory_data = self._load_memory()
+        # 记忆存储（追加日志/SQLite，按配置选择；首次启动自动迁移旧版temp_memory.json）
+        self.store = open_memory_store(character_id, "temp")
+        self._lock = threading.RLock()  # 后台维护线程与聊天流程并发清理/添加
+        self.memory_data = deque()      # 按创建时间排序的临时记忆
+        self._timestamps = deque()      # 与memory_data一一对应的创建时间戳
+        self._load_memory()
         self._clean_expired_memory()  # 初始化清理过期
 
     def _load_memory(self):
-        """加载临时记忆"""
-        return load_from_json(self.file_path)
+        """加载临时记忆（只在启动时解析一次create_time），时间格式异常的直接清理"""
+        entries = []
+        invalid_ids = []
+        for item in self.store.load_all():
+            ensure_memory_id(item)
+            timestamp = _parse_timestamp(item.get("create_time"))
+            if timestamp is None:
+                invalid_ids.append(item["memory_id"])
+            else:
+                entries.append((timestamp, item))
+        # 旧数据可能不是按时间追加的，排序一次（稳定排序，同一秒内保持写入顺序）
+        entries.sort(key=lambda entry: entry[0])
+        for timestamp, item in entries:
+            self._timestamps.append(timestamp)
+            self.memory_data.append(item)
+        self.store.delete_many(invalid_ids)
 
     def _clean_expired_memory(self):
-        """清理过期临时记忆"""
-        expire_time = datetime.now() - timedelta(days=TEMP_MEMORY_EXPIRE_DAYS)
-        valid_memory = []
-        for item in self.memory_data:
-            try:
-                create_time = datetime.strptime(item["create_time"], "%Y-%m-%d %H:%M:%S")
-                if create_time > expire_time:
-                    valid_memory.append(item)
-            except:
-                continue
-        self.memory_data = valid_memory
-        save_to_json(self.file_path, self.memory_data)
+        """清理过期/超出条数上限的临时记忆：只从队头弹出，无过期项则不写文件"""
+        expire_before = time.time() - TEMP_MEMORY_EXPIRE_DAYS * 86400
+        with self._lock:
+            expired_ids = []
+            while self._timestamps and (
+                self._timestamps[0] <= expire_before
+                or (TEMP_MEMORY_MAX_ENTRIES and len(self._timestamps) > TEMP_MEMORY_MAX_ENTRIES)
+            ):
+                self._timestamps.popleft()
+                expired_ids.append(self.memory_data.popleft()["memory_id"])
+            # 只记录被清理的ID
+            self.store.delete_many(expired_ids)
 
     def add_temp_memory(self, content, chat_context=""):
-        """添加临时记忆"""
+        """添加临时记忆（存储只追加一条记录）"""
+        now = datetime.now().replace(microsecond=0)
         memory_item = {
+            "memory_id": new_memory_id(),
             "content": content,
             "chat_context": chat_context,
-            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "create_time": now.strftime(TIME_FORMAT)
         }
-        self.memory_data.append(memory_item)
-        self._clean_expired_memory()  # 添加后清理
-        save_to_json(self.file_path, self.memory_data)
+        with self._lock:
+            self.memory_data.append(memory_item)
+            self._timestamps.append(now.timestamp())
+            self.store.add(memory_item)
+            self._clean_expired_memory()  # 添加后清理
 
     def get_all_temp_memory(self):
-        """获取所有有效临时记忆（全量）"""
-        self._clean_expired_memory()
-        return self.memory_data
\ No newline at end of file
+        """获取所有有效临时记忆（全量，按时间从旧到新）"""
+        with self._lock:
+            self._clean_expired_memory()
+            return list(self.memory_data)
+
+    def get_recent_temp_memory(self, count):
+        """获取最近count条有效临时记忆（按时间从旧到新），只遍历这count条"""
+        with self._lock:
+            self._clean_expired_memory()
+            recent = list(itertools.islice(reversed(self.memory_data), max(0, count)))
+        recent.reverse()
+        return recent
\ No newline at end of file
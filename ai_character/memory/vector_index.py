@@ -0,0 +1,314 @@
+# /root/ai_character/memory/vector_index.py
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from config import (
+    MEMORY_BASE_PATH, MEMORY_RETRIEVAL_MODE, MEMORY_VECTOR_ENCODER, MEMORY_VECTOR_DIM,
+    MEMORY_VECTOR_TOP_K, MEMORY_VECTOR_MIN_SCORE
+)
+
+try:
+    import numpy as np
+except ImportError:  # 向量检索为可选功能，未安装numpy时回退到锚点检索
+    np = None
+
+# 哈希向量使用的字n-gram长度
+HASHED_NGRAM_SIZES = (1, 2, 3)
+# 矩阵初始行数（不够时翻倍扩容）
+INITIAL_CAPACITY = 64
+# 行映射变更日志超过该条数（且超过当前记忆数）时重写快照并清空日志
+META_LOG_COMPACT_MIN = 256
+_NORMALIZE_PATTERN = re.compile(r"[\W_]+")
+
+class HashedNgramEncoder:
+    """
+    零依赖编码器：字1-3gram哈希到固定维度，词频取1+log(tf)
+    IDF由索引按当前文档频次在查询时计算（新增/删除记忆不需要重新编码已有向量）
+    """
+    use_idf = True
+
+    def __init__(self, dim=MEMORY_VECTOR_DIM):
+        self.dim = dim
+        self.name = f"hashed-ngram-{dim}"
+
+    def encode(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = _NORMALIZE_PATTERN.sub("", (text or "").lower())
+            counts = Counter(
+                zlib.crc32(text[start:start + size].encode("utf-8")) % self.dim
+                for size in HASHED_NGRAM_SIZES
+                for start in range(len(text) - size + 1)
+            )
+            for bucket, count in counts.items():
+                matrix[row, bucket] = 1.0 + math.log(count)
+        return matrix
+
+class SentenceEncoder:
+    """本地句向量模型（sentence-transformers，仅CPU，不联网），输出已归一化的稠密向量"""
+    use_idf = False
+
+    def __init__(self, model_path):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_path, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-{os.path.basename(model_path.rstrip('/'))}-{self.dim}"
+
+    def encode(self, texts):
+        return np.asarray(self.model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_encoder():
+    """获取共享编码器：MEMORY_VECTOR_ENCODER为hashed或本地模型目录（加载失败回退到哈希编码）"""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            if MEMORY_VECTOR_ENCODER == "hashed":
+                _encoder = HashedNgramEncoder()
+            else:
+                try:
+                    _encoder = SentenceEncoder(MEMORY_VECTOR_ENCODER)
+                except Exception as e:
+                    print(f"⚠️ 加载本地句向量模型失败：{e} → 使用字n-gram哈希向量")
+                    _encoder = HashedNgramEncoder()
+        return _encoder
+
+def _content_hash(item):
+    return hashlib.sha1(item["content"].encode("utf-8")).hexdigest()[:16]
+
+class VectorIndex:
+    """
+    记忆向量索引：所有向量存放在一个连续的float32矩阵中（.npy文件，内存映射读写）
+    行号↔memory_id映射 = .json快照 + .log追加日志（每次新增/删除只追加变更的行，日志过长或扩容/对齐时重写快照）
+    新增/更新只写对应的行，删除把该行清零并放回空闲行堆（优先复用行号小的行）；查询为批量余弦相似度top-k
+    """
+    def __init__(self, matrix_path, encoder):
+        self.matrix_path = matrix_path
+        self.meta_path = os.path.splitext(matrix_path)[0] + ".json"
+        self.log_path = os.path.splitext(matrix_path)[0] + ".log"
+        self.encoder = encoder
+        self._rows = {}       # {memory_id: 行号}
+        self._hashes = {}     # {memory_id: 内容摘要}，内容变化时重新编码
+        self._row_ids = []    # 行号 → memory_id（空闲行为None）
+        self._free_rows = []  # 空闲行号（最小堆）
+        self._used = 0        # 用过的最大行号+1，查询只计算这部分
+        self._log_count = 0   # 快照之后追加的变更条数
+        self._matrix = None
+        self._doc_freq = None  # 各维度的文档频次（哈希编码计算IDF用）
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+        try:
+            self._load()
+        except Exception as e:
+            print(f"⚠️ 记忆向量索引无法加载：{e} → 重新构建")
+            self._reset()
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)):
+            self._reset()
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(self.matrix_path, mmap_mode="r+")
+        if meta.get("encoder") != self.encoder.name or matrix.shape[1] != self.encoder.dim \
+                or len(meta["rows"]) != matrix.shape[0]:
+            raise ValueError("编码器或矩阵尺寸已变化")
+        self._matrix = matrix
+        entries = list(meta["rows"])
+        # 重放快照之后的变更日志（写了一半的最后一行跳过）
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row, memory_id, content_hash = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue
+                    if 0 <= row < len(entries):
+                        entries[row] = [memory_id, content_hash] if memory_id else None
+                        self._log_count += 1
+        self._row_ids = [entry[0] if entry else None for entry in entries]
+        for row, entry in enumerate(entries):
+            if entry:
+                self._rows[entry[0]] = row
+                self._hashes[entry[0]] = entry[1]
+                self._used = row + 1
+            else:
+                self._free_rows.append(row)
+        heapq.heapify(self._free_rows)
+        self._doc_freq = np.count_nonzero(self._matrix, axis=0).astype(np.float64)
+
+    def _reset(self):
+        """新建空索引"""
+        self._rows, self._hashes = {}, {}
+        self._row_ids = [None] * INITIAL_CAPACITY
+        self._free_rows = list(range(INITIAL_CAPACITY))
+        self._used = 0
+        self._matrix = np.lib.format.open_memmap(
+            self.matrix_path, mode="w+", dtype=np.float32, shape=(INITIAL_CAPACITY, self.encoder.dim)
+        )
+        self._doc_freq = np.zeros(self.encoder.dim, dtype=np.float64)
+        self._save_meta()
+
+    def _save_meta(self):
+        """刷新矩阵并原子写入行映射快照，清空变更日志（需持有self._lock）"""
+        self._matrix.flush()
+        tmp_path = f"{self.meta_path}.tmp"
+        rows = [[memory_id, self._hashes[memory_id]] if memory_id else None for memory_id in self._row_ids]
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"encoder": self.encoder.name, "rows": rows}, f)
+        os.replace(tmp_path, self.meta_path)
+        # 快照已包含全部变更（崩溃在两步之间时重放日志结果相同）
+        open(self.log_path, "w").close()
+        self._log_count = 0
+
+    def _append_meta_log(self, rows):
+        """刷新矩阵后把变更的行追加到日志（需持有self._lock）；日志过长时改为重写快照"""
+        if self._log_count + len(rows) > max(META_LOG_COMPACT_MIN, len(self._rows)):
+            self._save_meta()
+            return
+        self._matrix.flush()
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                memory_id = self._row_ids[row]
+                f.write(json.dumps([row, memory_id, self._hashes.get(memory_id) if memory_id else None]) + "\n")
+        self._log_count += len(rows)
+
+    def _grow(self, needed):
+        """空闲行不足时翻倍扩容（新矩阵写好后原子替换）"""
+        capacity = len(self._row_ids)
+        new_capacity = capacity
+        while new_capacity - len(self._rows) < needed:
+            new_capacity *= 2
+        if new_capacity == capacity:
+            return
+        tmp_path = f"{self.matrix_path}.tmp.npy"
+        new_matrix = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.encoder.dim)
+        )
+        new_matrix[:capacity] = self._matrix
+        new_matrix.flush()
+        del new_matrix
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+        self._row_ids.extend([None] * (new_capacity - capacity))
+        for row in range(capacity, new_capacity):
+            heapq.heappush(self._free_rows, row)
+        # 行数变化，重写快照
+        self._save_meta()
+
+    def _clear_row(self, memory_id):
+        row = self._rows.pop(memory_id)
+        self._hashes.pop(memory_id, None)
+        self._doc_freq -= self._matrix[row] != 0
+        self._matrix[row] = 0
+        self._row_ids[row] = None
+        heapq.heappush(self._free_rows, row)
+        return row
+
+    def upsert_many(self, items):
+        """新增/更新记忆向量（内容未变化的跳过），批量编码"""
+        with self._lock:
+            changed = [
+                item for item in items
+                if item.get("content") and self._hashes.get(item["memory_id"]) != _content_hash(item)
+            ]
+            if not changed:
+                return 0
+            vectors = self.encoder.encode([item["content"] for item in changed])
+            touched = set()
+            for item in changed:
+                if item["memory_id"] in self._rows:
+                    touched.add(self._clear_row(item["memory_id"]))
+            self._grow(len(changed))
+            for item, vector in zip(changed, vectors):
+                row = heapq.heappop(self._free_rows)
+                self._matrix[row] = vector
+                self._doc_freq += vector != 0
+                self._rows[item["memory_id"]] = row
+                self._hashes[item["memory_id"]] = _content_hash(item)
+                self._row_ids[row] = item["memory_id"]
+                self._used = max(self._used, row + 1)
+                touched.add(row)
+            self._append_meta_log(sorted(touched))
+            return len(changed)
+
+    def upsert(self, item):
+        return self.upsert_many([item])
+
+    def delete(self, memory_ids):
+        """删除记忆向量（不存在的ID忽略）"""
+        with self._lock:
+            memory_ids = [memory_id for memory_id in memory_ids if memory_id in self._rows]
+            rows = [self._clear_row(memory_id) for memory_id in memory_ids]
+            if rows:
+                self._append_meta_log(rows)
+
+    def sync(self, items):
+        """与当前记忆对齐：编码新增/内容变化的记忆，删除已不存在的记忆（启动/梳理后调用）"""
+        with self._lock:
+            live_ids = {item["memory_id"] for item in items}
+            self.delete([memory_id for memory_id in self._rows if memory_id not in live_ids])
+            self.upsert_many(items)
+            if self._log_count:
+                self._save_meta()
+
+    def search(self, texts, top_k=MEMORY_VECTOR_TOP_K, min_score=MEMORY_VECTOR_MIN_SCORE):
+        """批量余弦相似度top-k：返回与texts顺序一致的[[(memory_id, 相似度), ...], ...]"""
+        if not texts:
+            return []
+        queries = self.encoder.encode(texts)
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in texts]
+            used = self._used
+            matrix = self._matrix[:used]
+            if self.encoder.use_idf:
+                # TF-IDF余弦：查询与文档都按IDF加权（空闲行全为0，相似度为0）
+                idf = np.log((1.0 + len(self._rows)) / (1.0 + self._doc_freq)) + 1.0
+                queries = queries * idf
+                doc_norms = np.sqrt(np.square(matrix) @ np.square(idf))
+                scores = (matrix @ (queries * idf).T).T
+            else:
+                doc_norms = np.linalg.norm(matrix, axis=1)
+                scores = queries @ matrix.T
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = np.nan_to_num(scores / (query_norms * doc_norms))
+            row_ids = self._row_ids[:used]
+        results = []
+        k = min(top_k, scores.shape[1])
+        for row_scores in scores:
+            top_rows = np.argpartition(-row_scores, k - 1)[:k]
+            top_rows = top_rows[np.argsort(-row_scores[top_rows])]
+            results.append([
+                (row_ids[row], float(row_scores[row])) for row in top_rows
+                if row_ids[row] is not None and row_scores[row] >= min_score
+            ])
+        return results
+
+_numpy_warned = False
+
+def open_vector_index(character_id, tier):
+    """按配置打开某层记忆的向量索引；未启用向量检索或未安装numpy时返回None"""
+    global _numpy_warned
+    if MEMORY_RETRIEVAL_MODE not in ("vector", "hybrid"):
+        return None
+    if np is None:
+        if not _numpy_warned:
+            _numpy_warned = True
+            print("⚠️ 向量检索需要numpy（pip install numpy）→ 回退到锚点检索")
+        return None
+    try:
+        return VectorIndex(os.path.join(MEMORY_BASE_PATH, f"{character_id}_{tier}_vectors.npy"), get_encoder())
+    except Exception as e:
+        print(f"⚠️ 记忆向量索引初始化失败：{e} → 回退到锚点检索")
+        return None
\ No newline at end of file
@@ -0,0 +1,5 @@
+# /root/ai_character/pipeline/__init__.py
+# 聊天流程编排模块包初始化
+from .turn_pipeline import TurnPipeline, StageOutputCapture
+
+__all__ = ["TurnPipeline", "StageOutputCapture"]
\ No newline at end of file
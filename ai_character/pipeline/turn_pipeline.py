@@ -0,0 +1,164 @@
+# /root/ai_character/pipeline/turn_pipeline.py
+import asyncio
+import io
+import sys
+import threading
+from config import REPLY_STREAMING
+
+class StageOutputCapture:
+    """按线程捕获各阶段的打印输出：并发执行时按原串行顺序回放，终端输出保持不变"""
+    def __init__(self, stream):
+        self.stream = stream
+        self._buffers = {}
+        # 阶段名 → 之前所有阶段的输出是否已回放（流式输出需等待，保证终端顺序）
+        self._replay_ready = {}
+
+    def bind(self, buffer):
+        """当前线程的输出写入buffer"""
+        self._buffers[threading.get_ident()] = buffer
+
+    def unbind(self):
+        """当前线程恢复直接输出到终端"""
+        self._buffers.pop(threading.get_ident(), None)
+
+    def mark_replay_ready(self, stage_name):
+        """stage_name之前的阶段输出已全部回放"""
+        self._replay_ready.setdefault(stage_name, threading.Event()).set()
+
+    def write_through(self, text, stage_name, text_first=False):
+        """流式输出：等之前阶段的输出回放完，把当前线程已缓冲的内容连同text立即写到终端"""
+        self._replay_ready.setdefault(stage_name, threading.Event()).wait()
+        if text_first:
+            self.stream.write(text)
+        buffer = self._buffers.get(threading.get_ident())
+        if buffer is not None:
+            self.stream.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+        if not text_first:
+            self.stream.write(text)
+        self.stream.flush()
+
+    def write(self, text):
+        buffer = self._buffers.get(threading.get_ident())
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if threading.get_ident() not in self._buffers:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class TurnPipeline:
+    """
+    单轮聊天编排：按依赖关系并发执行各阶段
+    情感判断 ‖ 锚点提取 → 生成回复 → 表情包 ‖ 语音 ‖ 聊天记录
+    开启REPLY_STREAMING时，回复在生成过程中即逐段打印
+    """
+    def __init__(self, character, emoji_manager, speak_finish, chat_logger):
+        self.character = character
+        self.emoji_manager = emoji_manager
+        self.speak_finish = speak_finish
+        self.chat_logger = chat_logger
+
+    def _build_stages(self, user_input, capture):
+        """
+        构建本轮的阶段列表：(阶段名, 依赖阶段, 执行函数)
+        函数参数依次为依赖阶段的结果；列表顺序即终端输出的回放顺序
+        """
+        character = self.character
+        stream_state = {"text": ""}  # 本轮已流式输出的回复文本
+        return [
+            # 1. 先更新情感值（发消息即恢复，无暂停）；与锚点提取互不依赖
+            ("emotion", (), lambda: character._update_emotion_value(user_input)),
+            ("anchors", (), lambda: character.memory_manager.extract_input_anchors(user_input)),
+            # 2. 生成芙宁娜回复（依赖最新情感值+输入锚点词）
+            ("reply", ("emotion", "anchors"), lambda _, anchors: self._generate_reply(
+                user_input, anchors, capture, stream_state
+            )),
+            # 3. 表情包/语音/聊天记录只依赖回复文本，可同时开始
+            ("emoji", ("reply",), lambda reply: self.emoji_manager.get_emoji_image_by_text(
+                reply, character.emotion_value
+            )),
+            ("voice", ("reply", "anchors"), lambda reply, anchors: self.speak_finish.process_voice_response(
+                user_input, reply, input_anchors=anchors
+            )),
+            # 4. 输出回复
+            ("output", ("reply", "emoji", "voice"), lambda reply, emoji_image, voice_result: self._print_reply(
+                reply, emoji_image, voice_result, streamed_text=stream_state["text"]
+            )),
+            # 5. 记录聊天（自动检查跨天总结）
+            ("log", ("reply", "emotion"), lambda reply, emotion: self.chat_logger.log_chat(
+                user_input, reply, emotion=emotion
+            )),
+        ]
+
+    def _generate_reply(self, user_input, anchors, capture, stream_state):
+        """生成回复；开启流式时模型输出的片段直接打印到终端"""
+        if not REPLY_STREAMING:
+            return self.character.get_response(user_input, input_anchors=anchors)
+
+        def on_chunk(chunk):
+            prefix = "" if stream_state["text"] else "\n芙宁娜："
+            stream_state["text"] += chunk
+            capture.write_through(prefix + chunk, "reply")
+
+        reply = self.character.get_response(user_input, input_anchors=anchors, on_chunk=on_chunk)
+        if stream_state["text"]:
+            capture.write_through("\n", "reply", text_first=True)  # 流式输出结束换行，再输出生成后的日志
+        return reply
+
+    def _print_reply(self, furenna_reply, emoji_image, voice_result, streamed_text=""):
+        """输出芙宁娜回复+表情包/语音/情感值提示（回复已流式输出过则只补充提示）"""
+        emoji_tip = f"\n📸 匹配表情包：{emoji_image}" if emoji_image else ""
+        voice_tip = f"\n🎵 语音文件：{voice_result['voice_file']}" if voice_result['voice_file'] else ""
+        if len(voice_result.get("voice_chunks", [])) > 1:
+            voice_tip += f"（分句合成，共{len(voice_result['voice_chunks'])}段）"
+        emotion_tip = f"\n❤️ 芙宁娜当前情感值：{self.character.emotion_value}"
+        if not streamed_text:
+            print(f"\n芙宁娜：{furenna_reply}{emoji_tip}{voice_tip}{emotion_tip}")
+        elif streamed_text.strip() == furenna_reply:
+            print(f"{emoji_tip}{voice_tip}{emotion_tip}".lstrip("\n"))
+        else:
+            # 流式输出的初始回复被OOC调整/生成失败替换，重新输出最终回复
+            print(f"\n芙宁娜（调整后）：{furenna_reply}{emoji_tip}{voice_tip}{emotion_tip}")
+
+    @staticmethod
+    def _call_captured(capture, buffer, func, args):
+        """在工作线程中执行阶段函数，输出写入该阶段的缓冲区"""
+        capture.bind(buffer)
+        try:
+            return func(*args)
+        finally:
+            capture.unbind()
+
+    async def _run_stages(self, stages, capture):
+        """所有阶段同时调度，各自等待依赖完成；按列表顺序回放输出"""
+        tasks = {}
+        buffers = {name: io.StringIO() for name, _, _ in stages}
+
+        async def run_stage(name, deps, func):
+            dep_results = [await tasks[dep] for dep in deps]
+            return await asyncio.to_thread(self._call_captured, capture, buffers[name], func, dep_results)
+
+        for name, deps, func in stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name, deps, func))
+
+        results = {}
+        for name, _, _ in stages:
+            capture.mark_replay_ready(name)
+            results[name] = await tasks[name]
+            capture.stream.write(buffers[name].getvalue())
+            capture.stream.flush()
+        return results
+
+    def run_turn(self, user_input):
+        """执行一轮聊天，返回芙宁娜的回复"""
+        capture = StageOutputCapture(sys.stdout)
+        sys.stdout = capture
+        try:
+            results = asyncio.run(self._run_stages(self._build_stages(user_input, capture), capture))
+        finally:
+            sys.stdout = capture.stream
+        return results["reply"]
\ No newline at end of file
@@ -2,5 +2,6 @@
 # 提示词/反馈模块包初始化
 from .chat_logger import ChatLogger
 from .producer_feedback import ProducerFeedback
+from .summary_index import SummaryIndex
 
-__all__ = ["ChatLogger", "ProducerFeedback"]
\ No newline at end of file
+__all__ = ["ChatLogger", "ProducerFeedback", "SummaryIndex"]
\ No newline at end of file
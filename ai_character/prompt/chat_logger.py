@@ -1,34 +1,230 @@
 # /root/ai_character/prompt/chat_logger.py
 import os
+import glob
 import json
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 # 引用完整配置
-from config import CHAT_LOG_PATH, TEXT_CHAT_MODEL_PATH
+from config import CHAT_LOG_PATH, TEXT_CHAT_MODEL_PATH, SUMMARY_INCREMENTAL
+from utils.inference_worker import infer
+from utils.jsonl_writer import BufferedJSONLWriter, iter_jsonl, convert_json_to_jsonl
+from .summary_reducer import format_chat_line, split_chat_chunks, is_full_chunk, summarize_chunks, reduce_summaries
+from .summary_index import SummaryIndex
+
+# 后台增量总结失败后的重试间隔（秒）：每次连续失败翻倍，不超过上限；到期后由下一条聊天记录触发重试
+INCREMENTAL_RETRY_BASE_SECONDS = 60
+INCREMENTAL_RETRY_MAX_SECONDS = 1800
 
 class ChatLogger:
-    """聊天记录管理：自动跨天总结+每日归档"""
+    """
+    聊天记录管理：自动跨天总结+每日归档（每日日志为JSONL，缓冲追加写入）
+    每日总结为map-reduce：聊天中每满一块就在后台总结（分段总结存入partial文件），跨天时只总结剩余部分再合并
+    """
     def __init__(self, character_id="furenna"):
         self.character_id = character_id
         self.today = datetime.now().strftime("%Y-%m-%d")
+        # 旧版JSON数组日志转换为JSONL
+        self.convert_legacy_logs()
         # 日志保存路径（使用配置中的路径，已自动创建）
-        self.today_log_file = os.path.join(CHAT_LOG_PATH, f"{self.character_id}_chat_{self.today}.json")
+        self.today_log_file = self._log_file(self.today)
+        self._writer = BufferedJSONLWriter(self.today_log_file)
         # 每日总结路径（使用配置中的聊天日志路径+子目录，已自动创建）
         self.summary_dir = os.path.join(CHAT_LOG_PATH, "daily_summary")
+        # 日→周→月总结索引（日期范围查询）
+        self.summary_index = SummaryIndex(character_id, self.summary_dir)
+        # 跨天切换日志文件与追加聊天记录共用一把锁：聊天流程与后台维护线程都会检查跨天，避免重复总结、写入已关闭的旧文件
+        self._date_lock = threading.Lock()
+        # 跨天后的昨日总结在后台执行（调用模型期间不阻塞log_chat）
+        self._daily_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary-daily")
+        # 增量总结：尚未总结的今日聊天文本行（单线程后台执行，同一时间只有一个总结任务）
+        self._summary_lock = threading.Lock()
+        self._pending_lines = []
+        self._incremental_future = None
+        self._incremental_executor = None
+        self._incremental_failures = 0      # 连续失败次数
+        self._incremental_retry_at = 0.0    # 失败后下次允许重试的时间
+        if SUMMARY_INCREMENTAL:
+            self._incremental_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary-incremental")
+            self._restore_pending_lines()
+        atexit.register(self.close)  # 异常退出时也写入缓冲区中的记录
+
+    def _log_file(self, date):
+        return os.path.join(CHAT_LOG_PATH, f"{self.character_id}_chat_{date}.jsonl")
+
+    def _partial_file(self, date):
+        return os.path.join(self.summary_dir, f"{self.character_id}_partial_{date}.json")
+
+    def _load_partial(self, date):
+        """读取指定日期的增量总结进度：{date, summarized_turns（已总结的前N条）, chunk_summaries}"""
+        partial = {"date": date, "summarized_turns": 0, "chunk_summaries": []}
+        partial_file = self._partial_file(date)
+        if os.path.exists(partial_file):
+            try:
+                with open(partial_file, "r", encoding="utf-8") as f:
+                    partial.update(json.load(f))
+            except Exception as e:
+                print(f"⚠️ 增量总结进度读取失败，将重新总结：{partial_file}（{e}）")
+                partial = {"date": date, "summarized_turns": 0, "chunk_summaries": []}
+        return partial
+
+    def _save_partial(self, partial):
+        partial_file = self._partial_file(partial["date"])
+        tmp_file = f"{partial_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(partial, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, partial_file)
+
+    def _restore_pending_lines(self):
+        """启动时恢复今日尚未增量总结的聊天（跳过已总结的前N条）"""
+        summarized_turns = self._load_partial(self.today)["summarized_turns"]
+        for index, item in enumerate(iter_jsonl(self.today_log_file)):
+            if index >= summarized_turns:
+                self._pending_lines.append(format_chat_line(item))
+        self._submit_incremental_summary()
+
+    def _submit_incremental_summary(self):
+        """未总结的聊天凑满一块且后台空闲时，提交后台总结任务"""
+        with self._summary_lock:
+            if self._incremental_future is not None and not self._incremental_future.done():
+                return  # 上一个任务完成后会再次检查
+            if time.time() < self._incremental_retry_at:
+                return  # 上次失败，等重试间隔过后由下一条聊天记录触发
+            chunks = split_chat_chunks(self._pending_lines)
+            # 除最后一块外都已满（放不下下一行才切块），最后一块需达到上限
+            if chunks and not is_full_chunk(chunks[-1]):
+                chunks.pop()
+            if not chunks:
+                return
+            try:
+                self._incremental_future = self._incremental_executor.submit(
+                    self._incremental_summary, self.today, chunks
+                )
+            except RuntimeError:
+                return  # 已关闭（退出中），剩余部分下次启动时总结
+        # 任务期间新满的块在任务完成后接着总结（只在本次有进展时，失败时等下一条聊天记录按间隔重试）
+        self._incremental_future.add_done_callback(
+            lambda future: future.result() and self._submit_incremental_summary()
+        )
+
+    def _incremental_failed(self, reason):
+        """记录一次后台总结失败：只在连续失败的第一次输出，重试间隔翻倍"""
+        self._incremental_failures += 1
+        delay = min(INCREMENTAL_RETRY_MAX_SECONDS, INCREMENTAL_RETRY_BASE_SECONDS * 2 ** (self._incremental_failures - 1))
+        self._incremental_retry_at = time.time() + delay
+        if self._incremental_failures == 1:
+            print(f"⚠️ 后台增量总结失败：{reason} → {delay}秒后随新聊天重试（跨天/退出时仍会完整总结）")
+
+    def _incremental_summary(self, date, chunks):
+        """
+        后台总结已满的块，按顺序追加到增量总结进度（遇到失败的块即停止，下次从该块重试）
+        返回是否有进展（至少总结了一块）
+        """
+        try:
+            summaries = []
+            for summary in summarize_chunks(chunks, report_errors=self._incremental_failures == 0):
+                if not summary:
+                    break
+                summaries.append(summary)
+            if not summaries:
+                self._incremental_failed("模型没有返回分段总结")
+                return False
+            turns = sum(len(chunk) for chunk in chunks[:len(summaries)])
+            with self._summary_lock:
+                partial = self._load_partial(date)
+                partial["summarized_turns"] += turns
+                partial["chunk_summaries"].extend(summaries)
+                self._save_partial(partial)
+                if date == self.today:
+                    del self._pending_lines[:turns]
+            print(f"ℹ️ 后台已总结{len(summaries)}段聊天记录（{date}累计{partial['summarized_turns']}条）")
+            if len(summaries) < len(chunks):
+                # 部分分块失败：已完成的进度已保存，失败的块按间隔重试
+                self._incremental_failed("部分分段总结失败")
+                return False
+            if self._incremental_failures:
+                print("ℹ️ 后台增量总结已恢复")
+            self._incremental_failures = 0
+            self._incremental_retry_at = 0.0
+            return True
+        except Exception as e:
+            self._incremental_failed(e)
+            return False
+
+    def _wait_incremental_summary(self):
+        """等待进行中的后台总结完成（生成每日总结前调用，避免重复总结同一块）"""
+        future = self._incremental_future
+        if future is not None:
+            future.result()
+
+    def convert_legacy_logs(self):
+        """把旧版每日JSON日志（*_chat_日期.json）转换为JSONL，原文件改名为.migrated保留"""
+        for json_path in sorted(glob.glob(os.path.join(CHAT_LOG_PATH, f"{self.character_id}_chat_*.json"))):
+            try:
+                count = convert_json_to_jsonl(json_path, f"{json_path}l")
+                print(f"✅ 聊天记录已转换为JSONL：{json_path}（{count}条）")
+            except Exception as e:
+                print(f"⚠️ 转换旧聊天记录失败：{json_path}（{e}）")
+
+    def iter_chat_logs(self, date):
+        """逐条读取指定日期的聊天记录（当天的缓冲记录先写入文件）"""
+        if date == self.today:
+            self.flush()
+        return iter_jsonl(self._log_file(date))
+
+    def flush(self):
+        """把缓冲区中的聊天记录写入文件"""
+        self._writer.flush()
+
+    def close(self):
+        """
+        写入缓冲区中的聊天记录并关闭文件（退出时调用）
+        等待进行中的跨天总结完成；未完成的增量总结下次启动时重新总结
+        """
+        with self._date_lock:
+            self._writer.close()
+        self._daily_executor.shutdown(wait=True)
+        if self._incremental_executor is not None:
+            self._incremental_executor.shutdown(wait=False)
 
     def _check_date(self):
-        """检查是否跨天，跨天自动总结昨日聊天"""
+        """检查是否跨天，跨天自动总结昨日聊天（在后台执行，不等待总结完成）"""
+        with self._date_lock:
+            yesterday = self._switch_date_locked()
+        self._submit_daily_summary(yesterday)
+
+    def _switch_date_locked(self):
+        """跨天时切换到今日日志文件（需持有self._date_lock），返回需要总结的昨日日期（未跨天返回None）"""
         current_date = datetime.now().strftime("%Y-%m-%d")
-        if current_date != self.today:
-            print(f"📅 跨天啦！自动总结{self.today}的聊天记录...")
-            # 总结昨日记录
-            self.daily_summary(date=self.today)
-            # 更新今日日志文件
-            self.today = current_date
-            self.today_log_file = os.path.join(CHAT_LOG_PATH, f"{self.character_id}_chat_{self.today}.json")
-
-    def log_chat(self, user_input, character_response):
-        """记录聊天（自动检查跨天）"""
-        self._check_date()
+        if current_date == self.today:
+            return None
+        print(f"📅 跨天啦！自动总结{self.today}的聊天记录...")
+        # 写完昨日缓冲的记录后切换到今日日志文件
+        self._writer.close()
+        yesterday = self.today
+        self.today = current_date
+        self.today_log_file = self._log_file(self.today)
+        self._writer = BufferedJSONLWriter(self.today_log_file)
+        with self._summary_lock:
+            self._pending_lines = []
+        return yesterday
+
+    def _submit_daily_summary(self, date):
+        """后台总结昨日记录（等待昨日的后台增量总结后只总结剩余部分）"""
+        if date is None:
+            return
+        try:
+            self._daily_executor.submit(self.daily_summary, date=date)
+        except RuntimeError:
+            print(f"⚠️ 正在退出，{date}的聊天总结未生成，可稍后手动总结")
+
+    def log_chat(self, user_input, character_response, emotion=None):
+        """
+        记录聊天（自动检查跨天）
+        :param emotion: 本轮情感判断结果(倾向, 判断来源)，记录后可用于训练情感词典
+        """
         # 构建聊天记录项
         chat_item = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -37,40 +233,56 @@ class ChatLogger:
             "character_role": "芙宁娜",
             "character_response": character_response
         }
-        # 读取现有日志
-        if os.path.exists(self.today_log_file) and os.path.getsize(self.today_log_file) > 0:
-            with open(self.today_log_file, "r", encoding="utf-8") as f:
-                chat_logs = json.load(f)
-        else:
-            chat_logs = []
-        # 追加新记录
-        chat_logs.append(chat_item)
-        # 保存日志
-        with open(self.today_log_file, "w", encoding="utf-8") as f:
-            json.dump(chat_logs, f, ensure_ascii=False, indent=2)
-        print(f"📝 聊天记录已保存：{self.today_log_file}")
+        if emotion:
+            chat_item["emotion_tendency"], chat_item["emotion_source"] = emotion
+        with self._date_lock:
+            # 跨天切换与追加在同一把锁内，不会写入已关闭的昨日文件
+            yesterday = self._switch_date_locked()
+            # 追加一行（缓冲写入，不再读取/重写整个日志文件）
+            self._writer.append(chat_item)
+            log_file = self.today_log_file
+            if self._incremental_executor is not None:
+                with self._summary_lock:
+                    self._pending_lines.append(format_chat_line(chat_item))
+        print(f"📝 聊天记录已保存：{log_file}")
+        self._submit_daily_summary(yesterday)
+        if self._incremental_executor is not None:
+            self._submit_incremental_summary()
 
     def daily_summary(self, date=None):
-        """生成指定日期的聊天总结（无date则总结今日）"""
+        """
+        生成指定日期的聊天总结（无date则总结今日）
+        已由后台增量总结的部分直接复用分段总结，剩余聊天分块并发总结后合并（聊天很少时直接总结）
+        """
         target_date = date if date else self.today
-        target_log_file = os.path.join(CHAT_LOG_PATH, f"{self.character_id}_chat_{target_date}.json")
+        self._wait_incremental_summary()
+        partial = self._load_partial(target_date)
+        chunk_summaries = partial["chunk_summaries"]
+        summarized_turns = partial["summarized_turns"]
         
-        # 检查日志文件是否存在
-        if not os.path.exists(target_log_file) or os.path.getsize(target_log_file) == 0:
+        # 逐行读取聊天记录，只保留尚未总结的部分
+        chat_count = 0
+        chat_lines = []
+        for item in self.iter_chat_logs(target_date):
+            if chat_count >= summarized_turns:
+                chat_lines.append(format_chat_line(item))
+            chat_count += 1
+        
+        # 检查是否有聊天记录
+        if not chat_count:
             print(f"❌ {target_date}无聊天记录，无需总结！")
             return None
+        if summarized_turns > chat_count:
+            print(f"⚠️ {target_date}增量总结进度与聊天记录不一致，重新总结全部聊天")
+            chunk_summaries = []
+            chat_lines = [format_chat_line(item) for item in self.iter_chat_logs(target_date)]
         
-        # 读取聊天记录
-        with open(target_log_file, "r", encoding="utf-8") as f:
-            chat_logs = json.load(f)
-        
-        # 拼接聊天文本
-        chat_text = ""
-        for item in chat_logs:
-            chat_text += f"[{item['timestamp']}] 旅行者：{item['user_input']} | 芙宁娜：{item['character_response']}\n"
-        
-        # 构建总结提示词
-        summary_prompt = f"""
+        try:
+            chunks = split_chat_chunks(chat_lines)
+            if not chunk_summaries and len(chunks) <= 1:
+                # 聊天很少：直接总结
+                chat_text = "".join(chat_lines)
+                summary_prompt = f"""
         请总结以下芙宁娜与旅行者的聊天记录，要求：
         1. 核心要点：聊了哪些主要话题（歌剧/甜品/购物等）、芙宁娜的情绪变化；
         2. 格式：50字以内，简洁清晰，无冗余；
@@ -78,28 +290,27 @@ class ChatLogger:
         聊天记录：
         {chat_text}
         """
-        
-        try:
-            # 调用文本模型生成总结
-            import subprocess
-            result = subprocess.run(
-                [f"{TEXT_CHAT_MODEL_PATH}/infer.py", "--prompt", summary_prompt],
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
-            )
-            summary_content = result.stdout.strip()
+                summary_content = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", summary_prompt).strip()
+            else:
+                # map：剩余聊天分块并发总结；reduce：与已有分段总结按时间顺序合并
+                new_summaries = summarize_chunks(chunks)
+                failed = sum(1 for summary in new_summaries if not summary)
+                if failed:
+                    raise ValueError(f"{failed}段聊天记录总结失败")
+                summary_content = reduce_summaries(chunk_summaries + new_summaries)
+                print(f"ℹ️ {target_date}聊天记录分{len(chunk_summaries) + len(new_summaries)}段总结（后台已完成{len(chunk_summaries)}段）")
             
             # 保存总结
             summary_file = os.path.join(self.summary_dir, f"{self.character_id}_summary_{target_date}.json")
             summary_data = {
                 "date": target_date,
-                "chat_count": len(chat_logs),
+                "chat_count": chat_count,
                 "summary": summary_content,
                 "generate_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             with open(summary_file, "w", encoding="utf-8") as f:
                 json.dump(summary_data, f, ensure_ascii=False, indent=2)
+            self.summary_index.record_day(summary_data)
             
             print(f"✅ {target_date}聊天总结已保存：{summary_file}")
             print(f"📌 总结内容：{summary_content}")
@@ -108,31 +319,47 @@ class ChatLogger:
             print(f"⚠️ 生成聊天总结失败：{e}")
             return None
 
+    def range_summary(self, start_date, end_date):
+        """查询日期范围内的聊天总结（使用缓存的周/月汇总，不重新读取聊天记录）"""
+        try:
+            results = self.summary_index.query(start_date, end_date)
+        except ValueError:
+            print("❌ 日期格式错误！示例：/summary 2025-10-01..2025-10-31")
+            return None
+        if not results:
+            print(f"❌ {start_date}~{end_date}没有聊天总结！")
+            return None
+        print(f"📌 {start_date}~{end_date}聊天总结（共{sum(chat_count for _, _, chat_count in results)}条聊天）：")
+        for label, summary, chat_count in results:
+            print(f"  [{label}] {summary}（{chat_count}条）")
+        return results
+
     def export_chat_to_producer(self):
         """导出今日聊天记录给制作人（反馈优化用）"""
         self._check_date()
-        if not os.path.exists(self.today_log_file) or os.path.getsize(self.today_log_file) == 0:
-            print("❌ 今日无聊天记录可导出！")
-            return None
-        
-        # 读取今日日志
-        with open(self.today_log_file, "r", encoding="utf-8") as f:
-            chat_logs = json.load(f)
-        
-        # 转换为制作人反馈格式
-        export_data = []
-        for item in chat_logs:
-            export_data.append({
-                "user_input": item["user_input"],
-                "character_response": item["character_response"],
-                "correct_response": ""  # 留空给制作人填写正确回复
-            })
-        
         # 保存导出文件（使用配置中的制作人反馈路径）
         from config import PRODUCER_FEEDBACK_PATH
         export_file = os.path.join(PRODUCER_FEEDBACK_PATH, f"producer_feedback_{self.today}.json")
-        with open(export_file, "w", encoding="utf-8") as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+        tmp_file = f"{export_file}.tmp"
+        
+        # 逐行读取今日日志，转换为制作人反馈格式（JSON数组，逐项写入）
+        export_count = 0
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write("[")
+            for item in self.iter_chat_logs(self.today):
+                export_item = {
+                    "user_input": item["user_input"],
+                    "character_response": item["character_response"],
+                    "correct_response": ""  # 留空给制作人填写正确回复
+                }
+                f.write(("," if export_count else "") + "\n  " + json.dumps(export_item, ensure_ascii=False))
+                export_count += 1
+            f.write("\n]\n")
+        if not export_count:
+            os.remove(tmp_file)
+            print("❌ 今日无聊天记录可导出！")
+            return None
+        os.replace(tmp_file, export_file)
         
         print(f"✅ 聊天记录已导出给制作人：{export_file}")
         return export_file
\ No newline at end of file
@@ -0,0 +1,188 @@
+# /root/ai_character/prompt/summary_index.py
+import os
+import re
+import glob
+import json
+import calendar
+import threading
+from datetime import datetime, timedelta
+from config import SUMMARY_WEEKLY_MAX_CHARS, SUMMARY_MONTHLY_MAX_CHARS
+from .summary_reducer import reduce_summaries
+
+DATE_FORMAT = "%Y-%m-%d"
+_DAILY_FILE_PATTERN = re.compile(r"_summary_(\d{4}-\d{2}-\d{2})\.json$")
+# 汇总层级 → (提示词中的时间范围, 字数上限)
+ROLLUP_LEVELS = {"week": ("这一周", SUMMARY_WEEKLY_MAX_CHARS), "month": ("这个月", SUMMARY_MONTHLY_MAX_CHARS)}
+
+def week_key(day):
+    iso_year, iso_week, _ = day.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+def month_key(day):
+    return day.strftime("%Y-%m")
+
+class SummaryIndex:
+    """
+    聊天总结索引（日→周→月）：记录每日总结，周/月汇总按需生成并缓存
+    某天重新总结时只让该天所在的周、月汇总失效；日期范围查询由整月/整周汇总+零散日期拼成，不再读取原始聊天记录
+    """
+    def __init__(self, character_id="furenna", summary_dir=None):
+        self.character_id = character_id
+        self.summary_dir = summary_dir
+        self.index_file = os.path.join(summary_dir, f"{character_id}_summary_index.json")
+        self._lock = threading.RLock()
+        self.days = {}    # {日期: {"summary", "chat_count", "generate_time"}}
+        self.rollups = {"week": {}, "month": {}}  # {层级: {键: {"summary", "days", "chat_count", "generate_time"}}}
+        self._load_index()
+        self._backfill_daily_files()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index_data = json.load(f)
+            self.days = index_data.get("days", {})
+            for level in self.rollups:
+                self.rollups[level] = index_data.get(level, {})
+        except Exception as e:
+            print(f"⚠️ 聊天总结索引读取失败，将按每日总结文件重建：{e}")
+            self.days, self.rollups = {}, {"week": {}, "month": {}}
+
+    def _save_index(self):
+        """原子写入索引（需持有self._lock）"""
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"days": self.days, **self.rollups}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def _backfill_daily_files(self):
+        """把索引中还没有的每日总结文件加入索引（首次启用/旧版本生成的总结）"""
+        added = 0
+        with self._lock:
+            for summary_file in sorted(glob.glob(os.path.join(self.summary_dir, f"{self.character_id}_summary_*.json"))):
+                match = _DAILY_FILE_PATTERN.search(summary_file)
+                if not match or match.group(1) in self.days:
+                    continue
+                try:
+                    with open(summary_file, "r", encoding="utf-8") as f:
+                        self._record_day_locked(json.load(f))
+                    added += 1
+                except Exception as e:
+                    print(f"⚠️ 跳过无法读取的每日总结：{summary_file}（{e}）")
+            if added:
+                self._save_index()
+        if added:
+            print(f"✅ 聊天总结索引已加入{added}天的总结")
+
+    def _record_day_locked(self, summary_data):
+        day = summary_data["date"]
+        self.days[day] = {
+            "summary": summary_data["summary"],
+            "chat_count": summary_data.get("chat_count", 0),
+            "generate_time": summary_data.get("generate_time", ""),
+        }
+        # 只让这一天所在的周/月汇总失效
+        parsed = datetime.strptime(day, DATE_FORMAT).date()
+        self.rollups["week"].pop(week_key(parsed), None)
+        self.rollups["month"].pop(month_key(parsed), None)
+
+    def record_day(self, summary_data):
+        """记录（或更新）一天的总结：summary_data为daily_summary保存的内容"""
+        with self._lock:
+            self._record_day_locked(summary_data)
+            self._save_index()
+
+    def _days_between(self, start, end):
+        """start~end（含）之间有总结的日期，按时间顺序"""
+        start_text, end_text = start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+        return sorted(day for day in self.days if start_text <= day <= end_text)
+
+    def _cached_rollup(self, level, key, days):
+        """缓存中覆盖日期与当前一致的周/月汇总（需持有self._lock），只有一天时直接用该天的总结"""
+        if len(days) == 1:
+            return self.days[days[0]]["summary"]
+        cached = self.rollups[level].get(key)
+        if cached and cached["days"] == days:
+            return cached["summary"]
+        return None
+
+    def _build_rollup(self, level, days, day_records):
+        """由每日总结合并生成周/月汇总（调用模型，不持有self._lock）"""
+        period, limit = ROLLUP_LEVELS[level]
+        summary = reduce_summaries([f"{day}：{day_records[day]['summary']}" for day in days], period=period, limit=limit)
+        if not summary:
+            raise ValueError("模型返回了空的汇总")
+        return summary
+
+    def _store_rollup(self, level, key, days, day_records, summary):
+        """保存生成好的汇总；生成期间这些天被重新总结过则不缓存（需持有self._lock）"""
+        if any(self.days.get(day) != day_records[day] for day in days):
+            return
+        self.rollups[level][key] = {
+            "summary": summary,
+            "days": days,
+            "chat_count": sum(day_records[day]["chat_count"] for day in days),
+            "generate_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self._save_index()
+
+    def _plan(self, start, end):
+        """
+        把日期范围拆成整月/整周/单日（需持有self._lock）
+        :return: [(层级, 键, 有总结的日期, 缓存的总结或None), ...]
+        """
+        plan = []
+        day = start
+        while day <= end:
+            month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+            week_end = day + timedelta(days=6)
+            # 跨月的整周如果会占用下个整月的日期，改为逐日，让下个月用月汇总
+            next_month_start = month_end + timedelta(days=1)
+            next_month_covered = next_month_start.replace(
+                day=calendar.monthrange(next_month_start.year, next_month_start.month)[1]
+            ) <= end
+            if day.day == 1 and month_end <= end:
+                level, key, period_end = "month", month_key(day), month_end
+            elif day.weekday() == 0 and week_end <= end and not (week_end > month_end and next_month_covered):
+                level, key, period_end = "week", week_key(day), week_end
+            else:
+                level, key, period_end = "day", day.strftime(DATE_FORMAT), day
+            days = self._days_between(day, period_end)
+            if days:
+                cached = self.days[key]["summary"] if level == "day" else self._cached_rollup(level, key, days)
+                plan.append((level, key, days, cached))
+            day = period_end + timedelta(days=1)
+        return plan
+
+    def query(self, start_date, end_date):
+        """
+        查询日期范围内的聊天总结：范围内的整月用月汇总、整周（周一~周日）用周汇总、其余用每日总结
+        缺少的周/月汇总在锁外调用模型生成，生成期间不阻塞record_day
+        :return: [(标签, 总结, 聊天条数), ...]（按时间顺序，没有总结的日期/周/月跳过）
+        """
+        start = datetime.strptime(start_date, DATE_FORMAT).date()
+        end = datetime.strptime(end_date, DATE_FORMAT).date()
+        with self._lock:
+            plan = self._plan(start, end)
+            # 每日总结的快照（生成汇总期间这些天可能被重新总结）
+            day_records = {day: self.days[day] for _, _, days, _ in plan for day in days}
+        results = []
+        for level, key, days, summary in plan:
+            chat_count = sum(day_records[day]["chat_count"] for day in days)
+            if level == "day":
+                results.append((key, summary, chat_count))
+                continue
+            if summary is None:
+                try:
+                    summary = self._build_rollup(level, days, day_records)
+                except Exception as e:
+                    # 汇总生成失败：退回逐日列出
+                    print(f"⚠️ 生成{key}的聊天汇总失败：{e} → 逐日列出")
+                    results.extend((day, day_records[day]["summary"], day_records[day]["chat_count"]) for day in days)
+                    continue
+                with self._lock:
+                    self._store_rollup(level, key, days, day_records, summary)
+                print(f"✅ 已生成{key}的聊天汇总（{len(days)}天）")
+            results.append((f"{key}（{days[0]}~{days[-1]}，{len(days)}天）", summary, chat_count))
+        return results
\ No newline at end of file
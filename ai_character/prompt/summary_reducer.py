@@ -0,0 +1,114 @@
+# /root/ai_character/prompt/summary_reducer.py
+from concurrent.futures import ThreadPoolExecutor
+from utils.inference_worker import infer
+from config import TEXT_CHAT_MODEL_PATH, SUMMARY_CHUNK_MAX_CHARS, SUMMARY_CHUNK_MAX_TURNS, SUMMARY_WORKERS
+
+def format_chat_line(item):
+    """聊天记录项 → 总结用的一行文本"""
+    return f"[{item['timestamp']}] 旅行者：{item['user_input']} | 芙宁娜：{item['character_response']}\n"
+
+def split_chat_chunks(lines, max_chars=SUMMARY_CHUNK_MAX_CHARS, max_turns=SUMMARY_CHUNK_MAX_TURNS):
+    """按字数/轮数把聊天文本行切成若干块（保持顺序），返回[[行, ...], ...]"""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and (size + len(line) > max_chars or len(current) >= max_turns):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append(current)
+    return chunks
+
+def is_full_chunk(chunk, max_chars=SUMMARY_CHUNK_MAX_CHARS, max_turns=SUMMARY_CHUNK_MAX_TURNS):
+    """分块是否已满（增量总结只总结已满的块，未满的块等后续聊天补满）"""
+    return len(chunk) >= max_turns or sum(len(line) for line in chunk) >= max_chars
+
+def _summarize_chunk(chunk_text):
+    chunk_prompt = f"""
+        请总结以下芙宁娜与旅行者当天聊天记录中的一段，要求：
+        1. 要点：这一段聊了哪些话题（歌剧/甜品/购物等）、芙宁娜的情绪变化；
+        2. 格式：100字以内，简洁清晰，无冗余；
+        3. 语气：客观中立。
+        聊天记录：
+        {chunk_text}
+        """
+    summary = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", chunk_prompt).strip()
+    if not summary:
+        raise ValueError("模型返回了空的分段总结")
+    return summary
+
+def _map_parallel(func, texts, max_workers, report_errors, label):
+    """并发执行func，返回与texts顺序一致的结果列表，失败的为None"""
+    if not texts:
+        return []
+
+    def call_safely(text):
+        try:
+            return func(text)
+        except Exception as e:
+            if report_errors:
+                print(f"⚠️ {label}失败：{e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(texts))), thread_name_prefix="chat-summary") as executor:
+        return list(executor.map(call_safely, texts))
+
+def summarize_chunks(chunks, max_workers=SUMMARY_WORKERS, report_errors=True):
+    """
+    并发总结各分块（map），返回与chunks顺序一致的分段总结列表，失败的分块为None
+    :param chunks: [[行, ...], ...] 或 [文本, ...]
+    :param report_errors: 是否输出失败原因（后台重试时只在第一次失败时输出）
+    """
+    texts = [chunk if isinstance(chunk, str) else "".join(chunk) for chunk in chunks]
+    return _map_parallel(_summarize_chunk, texts, max_workers, report_errors, "分段总结")
+
+def _merge_summary_group(summaries_text, period):
+    merge_prompt = f"""
+        以下是芙宁娜与旅行者{period}聊天记录中连续几段的分段总结（按时间顺序），请合并为一段总结，要求：
+        1. 要点：保留各段聊到的话题（歌剧/甜品/购物等）和芙宁娜的情绪变化，不要遗漏任何一段；
+        2. 格式：100字以内，简洁清晰，无冗余；
+        3. 语气：客观中立。
+        分段总结：
+        {summaries_text}
+        """
+    summary = infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", merge_prompt).strip()
+    if not summary:
+        raise ValueError("模型返回了空的合并总结")
+    return summary
+
+def reduce_summaries(summaries, max_chars=SUMMARY_CHUNK_MAX_CHARS, period="当天", limit=50):
+    """
+    把按时间顺序排列的分段总结合并为最终的limit字总结（reduce；周/月汇总传入period）
+    分段总结总长超过max_chars时先分组合并为中间总结，再逐层合并（每层并发，耗时只随层数增长）
+    某组合并失败时保留该组原来的分段总结，不丢内容；一整层都没有合并成功时直接做最终合并
+    """
+    summaries = list(summaries)
+    while sum(len(summary) for summary in summaries) > max_chars and len(summaries) > 1:
+        groups = split_chat_chunks([f"{summary}\n" for summary in summaries], max_chars=max_chars, max_turns=len(summaries))
+        if len(groups) == len(summaries):
+            break  # 每条分段总结都已超过上限，无法再分组
+        merged = _map_parallel(
+            lambda text: _merge_summary_group(text, period), ["".join(group) for group in groups],
+            SUMMARY_WORKERS, True, "合并分段总结"
+        )
+        next_level = []
+        for group, summary in zip(groups, merged):
+            if summary:
+                next_level.append(summary)
+            else:
+                next_level.extend(line.rstrip("\n") for line in group)
+        if len(next_level) == len(summaries):
+            print("⚠️ 分段总结合并全部失败 → 直接生成最终总结")
+            break
+        summaries = next_level
+    numbered = "\n".join(f"{index}. {summary}" for index, summary in enumerate(summaries, 1))
+    reduce_prompt = f"""
+        以下是芙宁娜与旅行者{period}聊天记录的分段总结（按时间顺序），请合并为{period}的聊天总结，要求：
+        1. 核心要点：聊了哪些主要话题（歌剧/甜品/购物等）、芙宁娜的情绪变化；
+        2. 格式：{limit}字以内，简洁清晰，无冗余；
+        3. 语气：客观中立，符合日常聊天总结。
+        分段总结：
+        {numbered}
+        """
+    return infer(f"{TEXT_CHAT_MODEL_PATH}/infer.py", reduce_prompt).strip()
\ No newline at end of file
@@ -2,10 +2,17 @@
 # 工具模块包初始化
 from .file_operations import (
     save_to_json, load_from_json, get_today_date_str,
-    get_date_diff_days, extract_anchor_words_via_model
+    get_date_diff_days, extract_anchor_words_via_model, extract_anchor_words_many
 )
+from .inference_worker import infer, stream_infer, batch_infer, get_inference_pool, shutdown_inference_pools
+from .anchor_cache import AnchorCache, get_anchor_cache
+from .keyword_matcher import AhoCorasick
+from .jsonl_writer import BufferedJSONLWriter, iter_jsonl, convert_json_to_jsonl
 
 __all__ = [
     "save_to_json", "load_from_json", "get_today_date_str",
-    "get_date_diff_days", "extract_anchor_words_via_model"
+    "get_date_diff_days", "extract_anchor_words_via_model", "extract_anchor_words_many",
+    "infer", "stream_infer", "batch_infer", "get_inference_pool", "shutdown_inference_pools",
+    "AnchorCache", "get_anchor_cache", "AhoCorasick",
+    "BufferedJSONLWriter", "iter_jsonl", "convert_json_to_jsonl"
 ]
\ No newline at end of file
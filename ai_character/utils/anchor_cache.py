@@ -0,0 +1,121 @@
+# /root/ai_character/utils/anchor_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import ANCHOR_CACHE_ENABLED, ANCHOR_CACHE_PATH, ANCHOR_CACHE_MAX_ENTRIES, MEMORY_MODEL_PATH
+
+class AnchorCache:
+    """
+    锚点词提取两级缓存：进程内LRU（有界）+ 磁盘SQLite持久化
+    键为hash(文本, 模型路径, 最大数量)；记忆模型变化（路径或infer文件更新）时整体失效
+    """
+    def __init__(self, db_path=ANCHOR_CACHE_PATH, max_entries=ANCHOR_CACHE_MAX_ENTRIES, model_path=MEMORY_MODEL_PATH):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lru = OrderedDict()   # {key: anchor_words}
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS anchor_cache (key TEXT PRIMARY KEY, anchors TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._check_model(model_path)
+
+    @staticmethod
+    def _model_fingerprint(model_path):
+        """模型指纹：路径+infer文件修改时间（模型更新后缓存自动失效）"""
+        infer_file = os.path.join(model_path, "infer")
+        mtime = os.path.getmtime(infer_file) if os.path.exists(infer_file) else 0
+        return f"{model_path}|{mtime}"
+
+    def _check_model(self, model_path):
+        """记忆模型与上次不同则清空缓存"""
+        fingerprint = self._model_fingerprint(model_path)
+        row = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'model'").fetchone()
+        if row is not None and row[0] != fingerprint:
+            print(f"ℹ️ 记忆模型已变化，清空锚点词缓存：{self.db_path}")
+            self.clear()
+        self._conn.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('model', ?)", (fingerprint,))
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model_path, max_num):
+        return hashlib.sha256(json.dumps([text, model_path, max_num], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _remember(self, key, anchors):
+        """写入进程内LRU（超出上限淘汰最久未用的）"""
+        self._lru[key] = anchors
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, text, model_path, max_num):
+        """查缓存：先内存后磁盘，未命中返回None"""
+        key = self.make_key(text, model_path, max_num)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return list(self._lru[key])
+            row = self._conn.execute("SELECT anchors FROM anchor_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            anchors = json.loads(row[0])
+            self._remember(key, anchors)
+            self.stats["disk_hits"] += 1
+            return list(anchors)
+
+    def put(self, text, model_path, max_num, anchors):
+        """写缓存（内存+磁盘）"""
+        self.put_many([(text, anchors)], model_path, max_num)
+
+    def put_many(self, text_anchor_pairs, model_path, max_num):
+        """批量写缓存（一次磁盘提交）"""
+        rows = []
+        with self._lock:
+            for text, anchors in text_anchor_pairs:
+                key = self.make_key(text, model_path, max_num)
+                self._remember(key, list(anchors))
+                rows.append((key, json.dumps(anchors, ensure_ascii=False)))
+            self._conn.executemany("INSERT OR REPLACE INTO anchor_cache (key, anchors) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._lru.clear()
+            self._conn.execute("DELETE FROM anchor_cache")
+            self._conn.commit()
+
+    def hit_rate(self):
+        """命中率（内存+磁盘命中 / 总查询）"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+_anchor_cache = None
+_anchor_cache_failed = False
+_anchor_cache_lock = threading.Lock()
+
+def get_anchor_cache():
+    """获取全局锚点词缓存（未启用或初始化失败时返回None）"""
+    global _anchor_cache, _anchor_cache_failed
+    if not ANCHOR_CACHE_ENABLED or _anchor_cache_failed:
+        return None
+    with _anchor_cache_lock:
+        if _anchor_cache is None:
+            try:
+                _anchor_cache = AnchorCache()
+            except Exception as e:
+                print(f"⚠️ 锚点词缓存初始化失败：{e} → 不使用缓存")
+                _anchor_cache_failed = True
+                return None
+        return _anchor_cache
\ No newline at end of file
@@ -2,6 +2,8 @@
 import json
 import os
 from datetime import datetime
+from utils.inference_worker import infer, batch_infer
+from utils.anchor_cache import get_anchor_cache
 
 def save_to_json(file_path, data, ensure_ascii=False):
     """保存数据到JSON文件（追加/覆盖）"""
@@ -51,29 +53,62 @@ def get_date_diff_days(date_str1, date_str2):
         print(f"计算日期差失败：{e}")
         return 0
 
-def extract_anchor_words_via_model(text, model_path, max_num=5):
-    """调用本地记忆模型提取锚点词（宽泛、不冗余）"""
-    import subprocess
-    # 提示词：提取宽泛的锚点词，不要过于详细
-    anchor_prompt = f"""
+def _build_anchor_prompt(text, max_num):
+    """构建锚点词提取提示词：提取宽泛的锚点词，不要过于详细"""
+    return f"""
     请从以下文本中提取{max_num}个以内的宽泛锚点关键词（用于记忆检索，不要过于详细）：
     文本：{text}
     要求：1. 关键词宽泛（如"用户""生日""日期"，而非"2025年10月1日用户生日"）；
           2. 用英文逗号分隔；
           3. 仅输出关键词，无其他内容。
     """
+
+def _parse_anchor_words(model_output, max_num):
+    """清洗模型输出的锚点词，限制数量避免冗余"""
+    anchor_words = model_output.strip().split(",")
+    anchor_words = [kw.strip() for kw in anchor_words if kw.strip()]
+    return anchor_words[:max_num]
+
+def extract_anchor_words_via_model(text, model_path, max_num=5):
+    """调用本地记忆模型提取锚点词（宽泛、不冗余；先查锚点词缓存）"""
+    cache = get_anchor_cache()
+    if cache is not None:
+        cached = cache.get(text, model_path, max_num)
+        if cached is not None:
+            return cached
     try:
-        result = subprocess.run(
-            [f"{model_path}/infer", "--prompt", anchor_prompt],
-            capture_output=True,
-            text=True,
-            encoding="utf-8"
-        )
-        anchor_words = result.stdout.strip().split(",")
-        # 清洗锚点词
-        anchor_words = [kw.strip() for kw in anchor_words if kw.strip()]
-        return anchor_words[:max_num]  # 限制数量，避免冗余
+        anchor_words = _parse_anchor_words(infer(f"{model_path}/infer", _build_anchor_prompt(text, max_num)), max_num)
+        if cache is not None and anchor_words:
+            cache.put(text, model_path, max_num, anchor_words)
+        return anchor_words
     except Exception as e:
         print(f"提取锚点词失败：{e}")
         # 兜底：简单按空格分割取前max_num个
-        return text.split()[:max_num]
\ No newline at end of file
+        return text.split()[:max_num]
+
+def extract_anchor_words_many(texts, model_path, max_num=5):
+    """批量提取锚点词：多条文本合并为一次模型调用（缓存命中的不再调用），返回与texts顺序一致的锚点词列表"""
+    texts = list(texts)
+    cache = get_anchor_cache()
+    results = {}
+    if cache is not None:
+        for text in texts:
+            if text not in results:
+                cached = cache.get(text, model_path, max_num)
+                if cached is not None:
+                    results[text] = cached
+    # 未命中的文本去重后批量提取
+    pending = list(dict.fromkeys(text for text in texts if text not in results))
+    if pending:
+        try:
+            outputs = batch_infer(f"{model_path}/infer", [_build_anchor_prompt(text, max_num) for text in pending])
+            extracted = [_parse_anchor_words(output, max_num) for output in outputs]
+            if cache is not None:
+                cache.put_many(
+                    [(text, anchors) for text, anchors in zip(pending, extracted) if anchors], model_path, max_num
+                )
+            results.update(zip(pending, extracted))
+        except Exception as e:
+            print(f"批量提取锚点词失败：{e}")
+            results.update((text, text.split()[:max_num]) for text in pending)
+    return [list(results[text]) for text in texts]
\ No newline at end of file
@@ -0,0 +1,325 @@
+# /root/ai_character/utils/inference_worker.py
+import atexit
+import codecs
+import json
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+from config import INFER_WORKER_MODE, INFER_WORKER_POOL_SIZE, INFER_BATCH_MAX_SIZE, INFER_REQUEST_TIMEOUT
+
+def run_oneshot_infer(command, prompt):
+    """旧模式：单独启动一次infer进程完成推理（每次都会重新加载模型）"""
+    result = subprocess.run(
+        [command, "--prompt", prompt],
+        capture_output=True,
+        text=True,
+        encoding="utf-8"
+    )
+    return result.stdout
+
+def run_oneshot_batch_infer(command, prompts):
+    """旧模式下的批量推理：提示词写入临时文件，一次infer进程处理全部（--prompts_file，输出JSON列表）"""
+    fd, prompts_file = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(prompts, f, ensure_ascii=False)
+        result = subprocess.run(
+            [command, "--prompts_file", prompts_file],
+            capture_output=True,
+            text=True,
+            encoding="utf-8"
+        )
+        outputs = json.loads(result.stdout)
+        if not isinstance(outputs, list) or len(outputs) != len(prompts):
+            raise ValueError(f"批量输出数量不匹配：{len(prompts)}条提示词")
+        return [str(output) for output in outputs]
+    except Exception as e:
+        # infer不支持批量参数时，逐条调用兜底
+        print(f"⚠️ 批量推理失败：{e} → 逐条推理")
+        return [run_oneshot_infer(command, prompt) for prompt in prompts]
+    finally:
+        os.remove(prompts_file)
+
+def run_oneshot_stream_infer(command, prompt):
+    """旧模式下的流式推理：单独启动infer进程，stdout有输出就立即产出（生成器）"""
+    process = subprocess.Popen(
+        [command, "--prompt", prompt],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            data = process.stdout.read1(4096)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+        process.wait()
+    finally:
+        # 调用方中途停止读取时结束进程
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+class InferenceWorker:
+    """常驻推理进程：以 --serve 模式启动，stdin/stdout逐行传输JSON帧"""
+    def __init__(self, argv, cwd=None):
+        self.argv = argv
+        self.cwd = cwd
+        self.process = None
+        self.served_count = 0  # 成功处理的请求数（0表示从未正常工作过）
+        self._request_id = 0
+
+    def start(self):
+        """启动常驻进程（模型在进程内只加载一次）"""
+        self.process = subprocess.Popen(
+            self.argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            cwd=self.cwd
+        )
+
+    def is_alive(self):
+        """进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, payload, timeout=None):
+        """
+        发送一帧请求并读取一帧响应（timeout秒内无响应则结束进程，下次请求自动重启）
+        请求帧：{"id": 1, "prompt": "..."}；响应帧：{"id": 1, "output": "..."} 或 {"id": 1, "error": "..."}
+        批量帧：{"id": 2, "prompts": [...]}；响应帧：{"id": 2, "outputs": [...]}（与prompts顺序一致）
+        批量帧可带"options": [{"seed": 1, "temperature": 0.9}, ...]，与prompts一一对应的采样参数
+        """
+        if not self.is_alive():
+            self.start()
+        self._request_id += 1
+        frame = dict(payload, id=self._request_id)
+        self.process.stdin.write(json.dumps(frame, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+        response = json.loads(self._read_frame(timeout))
+        if response.get("error"):
+            raise RuntimeError(response["error"])
+        self.served_count += 1
+        return response
+
+    def _read_frame(self, timeout=None):
+        """读取一帧响应（timeout秒内无响应则结束进程并报错）"""
+        process = self.process
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            line = process.stdout.readline()
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if not line:
+            if timed_out.is_set():
+                raise TimeoutError(f"推理进程{timeout}秒内无响应：{' '.join(self.argv)}")
+            raise RuntimeError(f"推理进程已退出或无响应：{' '.join(self.argv)}")
+        return line
+
+    def stream_request(self, payload, timeout=None):
+        """
+        流式请求（生成器）：请求帧带"stream": true
+        响应为多帧{"id": 1, "delta": "..."}，以{"id": 1, "done": true}结束；
+        不支持流式的infer直接返回{"id": 1, "output": "..."}，整体作为一个片段产出
+        timeout为相邻两帧之间的最长等待时间（秒），超时结束进程
+        """
+        if not self.is_alive():
+            self.start()
+        self._request_id += 1
+        frame = dict(payload, id=self._request_id, stream=True)
+        self.process.stdin.write(json.dumps(frame, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+        while True:
+            response = json.loads(self._read_frame(timeout))
+            if response.get("error"):
+                raise RuntimeError(response["error"])
+            if response.get("delta"):
+                yield response["delta"]
+            if "output" in response:
+                yield response["output"]
+                break
+            if response.get("done"):
+                break
+        self.served_count += 1
+
+    def stop(self):
+        """关闭常驻进程"""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.close()
+                self.process.terminate()
+                self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+class InferenceWorkerPool:
+    """同一模型的常驻推理进程池：按需启动，最多pool_size个，失败时回退到一次性模式"""
+    def __init__(self, command, pool_size=INFER_WORKER_POOL_SIZE, mode=INFER_WORKER_MODE):
+        self.command = command
+        self.pool_size = max(1, pool_size)
+        self.mode = mode
+        self._idle_workers = queue.Queue()
+        self._all_workers = []
+        self._lock = threading.Lock()
+        # 非worker模式，或infer不支持--serve时，退化为一次性模式
+        self._degraded = mode != "worker"
+
+    def _acquire_worker(self):
+        """取一个空闲进程；池未满时新建，池满时等待归还"""
+        try:
+            return self._idle_workers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all_workers) < self.pool_size:
+                worker = InferenceWorker([self.command, "--serve"])
+                self._all_workers.append(worker)
+                return worker
+        return self._idle_workers.get()
+
+    def _release_worker(self, worker):
+        """归还进程到空闲队列"""
+        self._idle_workers.put(worker)
+
+    def _handle_worker_error(self, worker, error):
+        """进程出错：关闭该进程；从未正常工作过则整体退化为一次性模式"""
+        worker.stop()
+        if worker.served_count == 0:
+            self._degraded = True
+            print(f"⚠️ 常驻推理进程不可用：{error} → 回退到一次性推理模式（{self.command}）")
+        else:
+            print(f"⚠️ 常驻推理进程异常：{error} → 下次调用自动重启")
+
+    def infer(self, prompt):
+        """单条推理，返回模型原始输出"""
+        if self._degraded:
+            return run_oneshot_infer(self.command, prompt)
+        worker = self._acquire_worker()
+        try:
+            return worker.request({"prompt": prompt}, timeout=INFER_REQUEST_TIMEOUT).get("output", "")
+        except Exception as e:
+            self._handle_worker_error(worker, e)
+            return run_oneshot_infer(self.command, prompt)
+        finally:
+            self._release_worker(worker)
+
+    def stream_infer(self, prompt):
+        """流式推理（生成器）：逐段产出模型输出"""
+        if self._degraded:
+            yield from run_oneshot_stream_infer(self.command, prompt)
+            return
+        worker = self._acquire_worker()
+        started = False
+        finished = False
+        try:
+            for chunk in worker.stream_request({"prompt": prompt}, timeout=INFER_REQUEST_TIMEOUT):
+                started = True
+                yield chunk
+            finished = True
+        except Exception as e:
+            self._handle_worker_error(worker, e)
+            if started:
+                # 已产出部分内容，无法无缝重来，交给调用方处理
+                raise
+            yield from run_oneshot_stream_infer(self.command, prompt)
+            finished = True
+        finally:
+            if not finished:
+                # 调用方中途停止读取：进程里还有未读完的帧，直接关闭，下次调用自动重启
+                worker.stop()
+            self._release_worker(worker)
+
+    def batch_infer(self, prompts, options=None):
+        """
+        批量推理：每批最多INFER_BATCH_MAX_SIZE条提示词，一次模型调用返回全部结果（顺序与输入一致）
+        :param options: 与prompts一一对应的采样参数（一次性模式不支持，忽略）
+        """
+        outputs = []
+        for start in range(0, len(prompts), INFER_BATCH_MAX_SIZE):
+            end = start + INFER_BATCH_MAX_SIZE
+            outputs.extend(self._infer_one_batch(prompts[start:end], options[start:end] if options else None))
+        return outputs
+
+    def _infer_one_batch(self, prompts, options=None):
+        """单批推理"""
+        if self._degraded:
+            return run_oneshot_batch_infer(self.command, prompts)
+        worker = self._acquire_worker()
+        payload = {"prompts": prompts, "options": options} if options else {"prompts": prompts}
+        try:
+            outputs = worker.request(payload, timeout=INFER_REQUEST_TIMEOUT).get("outputs", [])
+            if len(outputs) != len(prompts):
+                raise ValueError(f"批量输出数量不匹配：{len(prompts)}条提示词，{len(outputs)}条输出")
+            return outputs
+        except Exception as e:
+            self._handle_worker_error(worker, e)
+            return run_oneshot_batch_infer(self.command, prompts)
+        finally:
+            self._release_worker(worker)
+
+    def shutdown(self):
+        """关闭池内所有常驻进程"""
+        with self._lock:
+            for worker in self._all_workers:
+                worker.stop()
+            self._all_workers = []
+        self._idle_workers = queue.Queue()
+
+# 全局进程池注册表：同一个infer命令在所有模块间共享一个池
+_inference_pools = {}
+_inference_pools_lock = threading.Lock()
+
+def get_inference_pool(command):
+    """获取（或创建）指定infer命令的共享进程池"""
+    with _inference_pools_lock:
+        pool = _inference_pools.get(command)
+        if pool is None:
+            pool = InferenceWorkerPool(command)
+            _inference_pools[command] = pool
+        return pool
+
+def infer(command, prompt):
+    """调用本地模型推理（所有模块共用的入口），返回模型原始输出"""
+    return get_inference_pool(command).infer(prompt)
+
+def stream_infer(command, prompt):
+    """流式调用本地模型推理（生成器），模型输出逐段产出，拼接后与infer结果一致"""
+    return get_inference_pool(command).stream_infer(prompt)
+
+def batch_infer(command, prompts, options=None):
+    """批量调用本地模型推理，返回与prompts顺序一致的原始输出列表（options为每条提示词的采样参数）"""
+    if not prompts:
+        return []
+    return get_inference_pool(command).batch_infer(list(prompts), list(options) if options else None)
+
+def shutdown_inference_pools():
+    """关闭所有常驻推理进程（程序退出时自动调用）"""
+    with _inference_pools_lock:
+        for pool in _inference_pools.values():
+            pool.shutdown()
+        _inference_pools.clear()
+
+atexit.register(shutdown_inference_pools)
\ No newline at end of file
@@ -0,0 +1,96 @@
+# /root/ai_character/utils/jsonl_writer.py
+import json
+import os
+import threading
+from config import CHAT_LOG_FLUSH_INTERVAL, CHAT_LOG_FLUSH_BATCH_SIZE, CHAT_LOG_FSYNC
+
+class BufferedJSONLWriter:
+    """
+    缓冲追加写入JSONL（每条记录一行）：记录先放入内存缓冲区，
+    满batch_size条或距第一条未写入记录超过flush_interval秒时一次性追加到文件
+    fsync为True时每次写入后fsync，保证断电不丢已写入的记录
+    """
+    def __init__(self, path, flush_interval=CHAT_LOG_FLUSH_INTERVAL,
+                 batch_size=CHAT_LOG_FLUSH_BATCH_SIZE, fsync=CHAT_LOG_FSYNC):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self._buffer = []
+        self._file = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        """追加一条记录（达到批量大小时立即写入，否则等定时写入）"""
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+            if len(self._buffer) >= self.batch_size or self.flush_interval <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending_count(self):
+        """缓冲区中尚未写入文件的记录数"""
+        return len(self._buffer)
+
+    def flush(self):
+        """把缓冲区中的记录写入文件"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._buffer = []
+
+    def close(self):
+        """写入剩余记录并关闭文件（跨天/退出时调用）"""
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def iter_jsonl(path):
+    """逐行读取JSONL文件（不把整个文件读入内存），跳过写了一半的损坏行"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ 跳过损坏的日志行：{path}")
+
+def convert_json_to_jsonl(json_path, jsonl_path):
+    """
+    把旧版JSON数组文件转换为JSONL（已有的JSONL记录排在旧记录之后），原文件改名为.migrated保留
+    返回转换的记录数
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f) if os.path.getsize(json_path) > 0 else []
+    tmp_path = f"{jsonl_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records if isinstance(records, list) else []:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for record in iter_jsonl(jsonl_path):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, jsonl_path)
+    os.replace(json_path, f"{json_path}.migrated")
+    return len(records) if isinstance(records, list) else 0
\ No newline at end of file
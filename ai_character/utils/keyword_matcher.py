@@ -0,0 +1,73 @@
+# /root/ai_character/utils/keyword_matcher.py
+from collections import deque
+
+class AhoCorasick:
+    """
+    多模式串匹配（Aho-Corasick自动机）：所有关键词预编译成一个自动机，一次扫描文本找出全部命中
+    扫描耗时只与文本长度有关，与关键词数量无关；重叠命中（如「神明」「本神明」）都会返回
+    """
+    def __init__(self, keywords=()):
+        self._goto = [{}]       # 状态转移：[{字符: 下一状态}]
+        self._fail = [0]        # 失配指针
+        self._output = [()]     # 每个状态结束的关键词
+        self.keywords = []
+        self.add_keywords(keywords)
+
+    def add_keywords(self, keywords):
+        """加入关键词并重新编译（重复/空关键词忽略）"""
+        for keyword in keywords:
+            keyword = keyword.strip().lower()
+            if keyword and keyword not in self.keywords:
+                self.keywords.append(keyword)
+        self._build()
+
+    def _build(self):
+        goto, output = [{}], [[]]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    output.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].append(keyword)
+        # 按层序计算失配指针，同时把失配状态的输出合并进来
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in goto[state].items():
+                pending.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] += output[fail[next_state]]
+        # 编译完成后一次性替换，扫描线程不会看到一半的自动机
+        self._goto, self._fail, self._output = goto, fail, [tuple(words) for words in output]
+
+    def find_all(self, text):
+        """返回文本中命中的全部关键词（按出现位置排序，可重复）"""
+        goto, fail, output = self._goto, self._fail, self._output
+        hits = []
+        state = 0
+        for char in (text or "").lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                hits.extend(output[state])
+        return hits
+
+    def contains_any(self, text):
+        """是否命中任意关键词（命中第一个即返回）"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in (text or "").lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
\ No newline at end of file
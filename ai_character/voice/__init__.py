@@ -2,5 +2,11 @@
 # 语音模块包初始化
 from .gpt_sovits_tts import GPTSoVITS_TTS
 from .speak_finish import SpeakFinish
+from .tts_pipeline import StreamingTTS, split_sentences
+from .tts_cache import TTSCache, get_tts_cache
+from .sovits_worker import SoVITSWorker
+from .playback_manager import PlaybackManager, get_playback_manager
 
-__all__ = ["GPTSoVITS_TTS", "SpeakFinish"]
\ No newline at end of file
+__all__ = ["GPTSoVITS_TTS", "SpeakFinish", "StreamingTTS", "split_sentences",
+           "TTSCache", "get_tts_cache", "SoVITSWorker",
+           "PlaybackManager", "get_playback_manager"]
\ No newline at end of file
@@ -1,8 +1,13 @@
 # /root/ai_character/voice/gpt_sovits_tts.py
+import atexit
 import os
 import subprocess
+import time
+import uuid
 # 引用完整配置中的路径
-from config import GPT_SOVITS_PATH, VOICE_OUTPUT_PATH
+from config import GPT_SOVITS_PATH, VOICE_OUTPUT_PATH, SOVITS_WORKER_MODE
+from .tts_cache import get_tts_cache
+from .sovits_worker import SoVITSWorker
 
 class GPTSoVITS_TTS:
     """GPT-SoVITS语音合成：适配已下载的芙宁娜模型"""
@@ -18,12 +23,30 @@ class GPTSoVITS_TTS:
         self.speed = 0.95  # 语速：稍缓（0.8-1.0），日常自然
         self.pitch = 1.0   # 音调：自然（1.0），无神明时期的高扬
         self.volume = 0.9  # 音量：适中
+        self.language = "zh"  # 语言：中文
+        # 常驻合成进程（语音模型只加载一次），不可用时回退到每次启动infer.py
+        self.sovits_worker = None
+        if SOVITS_WORKER_MODE == "worker" and os.path.exists(os.path.join(self.sovits_root, "infer.py")):
+            self.sovits_worker = SoVITSWorker(self.sovits_root, self.furenna_voice_id, self.language)
+            self.sovits_worker.prewarm()
+            atexit.register(self.sovits_worker.stop)
 
-    def generate_voice(self, text):
-        """生成芙宁娜的语音（适配已下载模型）"""
+    def generate_voice(self, text, voice_file=None):
+        """生成芙宁娜的语音（适配已下载模型，voice_file为空时自动生成文件名；相同文本+参数直接返回缓存）"""
+        cache = get_tts_cache()
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                text, self.furenna_voice_id, self.speed, self.pitch, self.volume, self.language
+            )
+            cached_file = cache.get(cache_key)
+            if cached_file:
+                print(f"✅ 芙宁娜语音命中缓存：{cached_file}")
+                return cached_file
         # 生成唯一语音文件名
-        timestamp = os.popen('date +%s').read().strip()
-        voice_file = os.path.join(self.output_dir, f"furenna_retired_{timestamp}.wav")
+        if voice_file is None:
+            timestamp = f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
+            voice_file = os.path.join(self.output_dir, f"furenna_retired_{timestamp}.wav")
         
         # 检查GPT-SoVITS关键文件是否存在（防止路径错误）
         infer_script = os.path.join(self.sovits_root, "infer.py")
@@ -32,39 +55,61 @@ class GPTSoVITS_TTS:
             return None
         
         try:
-            # 调用GPT-SoVITS生成语音（核心命令：适配已下载模型）
-            # 命令说明：--voice_id 是你的芙宁娜模型ID，--text 是要合成的文本
-            cmd = [
-                "python3", infer_script,
-                "--text", text,                  # 要合成的文本（芙宁娜的回复）
-                "--voice_id", str(self.furenna_voice_id),  # 你的芙宁娜模型ID
-                "--output", voice_file,          # 输出文件路径
-                "--speed", str(self.speed),      # 语速
-                "--pitch", str(self.pitch),      # 音调
-                "--volume", str(self.volume),    # 音量
-                "--language", "zh",              # 语言：中文
-                "--batch_size", "1",             # 批量大小：1（适配小模型）
-                "--split_sentence", "True"       # 分句合成：更自然
-            ]
-            # 执行命令（隐藏输出，仅报错时显示）
-            result = subprocess.run(
-                cmd,
-                cwd=self.sovits_root,  # 切换到GPT-SoVITS根目录执行
-                capture_output=True,
-                text=True,
-                encoding="utf-8"
+            error_output = ""
+            # 优先使用常驻合成进程（模型已加载，无需重新启动解释器）
+            synthesized = self.sovits_worker is not None and self.sovits_worker.synthesize(
+                text, voice_file,
+                speed=self.speed, pitch=self.pitch, volume=self.volume,
+                batch_size=1, split_sentence=True
             )
+            if not synthesized:
+                error_output = self._run_oneshot(infer_script, text, voice_file)
             # 检查是否生成成功
             if os.path.exists(voice_file) and os.path.getsize(voice_file) > 0:
+                # 移入缓存（缓存总大小有上限，旧语音文件自动淘汰）
+                if cache is not None:
+                    voice_file = cache.put(cache_key, voice_file)
                 print(f"✅ 芙宁娜语音生成成功：{voice_file}")
                 return voice_file
             else:
-                print(f"❌ 语音生成失败！GPT-SoVITS输出：{result.stderr}")
+                print(f"❌ 语音生成失败！GPT-SoVITS输出：{error_output}")
                 return None
         except Exception as e:
             print(f"⚠️ 调用GPT-SoVITS失败：{e}")
             return None
 
+    def _run_oneshot(self, infer_script, text, voice_file):
+        """一次性模式：单独启动infer.py合成（每次都会重新加载语音模型），返回错误输出"""
+        # 调用GPT-SoVITS生成语音（核心命令：适配已下载模型）
+        # 命令说明：--voice_id 是你的芙宁娜模型ID，--text 是要合成的文本
+        cmd = [
+            "python3", infer_script,
+            "--text", text,                  # 要合成的文本（芙宁娜的回复）
+            "--voice_id", str(self.furenna_voice_id),  # 你的芙宁娜模型ID
+            "--output", voice_file,          # 输出文件路径
+            "--speed", str(self.speed),      # 语速
+            "--pitch", str(self.pitch),      # 音调
+            "--volume", str(self.volume),    # 音量
+            "--language", self.language,     # 语言：中文
+            "--batch_size", "1",             # 批量大小：1（适配小模型）
+            "--split_sentence", "True"       # 分句合成：更自然
+        ]
+        # 执行命令（隐藏输出，仅报错时显示）
+        result = subprocess.run(
+            cmd,
+            cwd=self.sovits_root,  # 切换到GPT-SoVITS根目录执行
+            capture_output=True,
+            text=True,
+            encoding="utf-8"
+        )
+        return result.stderr
+
+    def release_voice(self, voice_file):
+        """语音文件用完（播放完/被打断跳过）后调用：解除缓存固定，之后才可能被淘汰"""
+        cache = get_tts_cache()
+        if cache is not None and voice_file:
+            cache.release(voice_file)
+
     def play_voice(self, voice_file):
         """播放生成的语音（Linux系统：aplay，Windows：start）"""
         if not os.path.exists(voice_file):
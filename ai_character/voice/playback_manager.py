@@ -0,0 +1,114 @@
+# /root/ai_character/voice/playback_manager.py
+import os
+import queue
+import subprocess
+import threading
+
+class PlaybackManager:
+    """
+    后台语音播放：待播放片段放入FIFO队列，由播放线程依次用aplay播放，终端输入不再等待语音播完
+    新消息到来时cancel_all()打断当前播放并丢弃队列中尚未播放的片段（barge-in）
+    """
+    def __init__(self, player_command=("aplay",)):
+        self.player_command = list(player_command)
+        self._queue = queue.Queue()        # [(代次, 语音文件, 播放结束回调)]
+        self._generation = 0               # 每次打断+1，旧代次的片段直接丢弃
+        self._current_process = None
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self.stats = {"enqueued": 0, "played": 0, "cancelled": 0, "failed": 0, "max_queue_depth": 0}
+        self._thread = threading.Thread(target=self._loop, name="voice-playback", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, voice_file, on_finish=None):
+        """
+        加入播放队列（立即返回）
+        :param on_finish: 该片段播放完/被打断跳过/播放失败后调用on_finish(voice_file)（如解除语音缓存固定）
+        """
+        with self._lock:
+            self._idle.clear()
+            self._queue.put((self._generation, voice_file, on_finish))
+            self.stats["enqueued"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+
+    def queue_depth(self):
+        """队列中等待播放的片段数（不含正在播放的）"""
+        return self._queue.qsize()
+
+    def is_playing(self):
+        """是否正在播放"""
+        process = self._current_process
+        return process is not None and process.poll() is None
+
+    def cancel_all(self):
+        """打断：停止当前播放，丢弃队列中所有待播放片段"""
+        with self._lock:
+            self._generation += 1
+            process = self._current_process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def wait_until_idle(self, timeout=None):
+        """等待队列播放完毕，返回是否已空闲"""
+        return self._idle.wait(timeout)
+
+    def _loop(self):
+        while True:
+            generation, voice_file, on_finish = self._queue.get()
+            try:
+                self._play(voice_file, generation)
+            finally:
+                if on_finish is not None:
+                    try:
+                        on_finish(voice_file)
+                    except Exception as e:
+                        print(f"⚠️ 语音播放结束回调失败：{e}")
+            with self._lock:
+                if self._queue.empty():
+                    self._idle.set()
+
+    def _play(self, voice_file, generation):
+        """播放一个片段（已被打断的代次直接跳过）"""
+        with self._lock:
+            if generation != self._generation:
+                self.stats["cancelled"] += 1
+                return
+            if not os.path.exists(voice_file):
+                print(f"❌ 语音文件不存在：{voice_file}")
+                self.stats["failed"] += 1
+                return
+            try:
+                if os.name == "nt":
+                    # Windows系统：默认播放器本身不阻塞
+                    os.startfile(voice_file)
+                    self.stats["played"] += 1
+                    return
+                process = subprocess.Popen(
+                    self.player_command + [voice_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+            except Exception as e:
+                print(f"⚠️ 播放语音失败：{e}")
+                self.stats["failed"] += 1
+                return
+            self._current_process = process
+        process.wait()
+        with self._lock:
+            self._current_process = None
+            if generation != self._generation:
+                self.stats["cancelled"] += 1
+            elif process.returncode == 0:
+                self.stats["played"] += 1
+            else:
+                self.stats["failed"] += 1
+
+_playback_manager = None
+_playback_manager_lock = threading.Lock()
+
+def get_playback_manager():
+    """获取全局语音播放管理器（首次调用时启动播放线程）"""
+    global _playback_manager
+    with _playback_manager_lock:
+        if _playback_manager is None:
+            _playback_manager = PlaybackManager()
+        return _playback_manager
\ No newline at end of file
@@ -0,0 +1,96 @@
+# /root/ai_character/voice/sovits_worker.py
+import os
+import threading
+import time
+from utils.inference_worker import InferenceWorker
+from config import SOVITS_HEALTH_CHECK_INTERVAL, SOVITS_PING_TIMEOUT, SOVITS_REQUEST_TIMEOUT
+
+class SoVITSWorker:
+    """
+    常驻GPT-SoVITS合成进程：python3 infer.py --serve 启动一次，芙宁娜语音模型常驻内存
+    stdin/stdout逐行传输JSON帧：
+      合成：{"id": 1, "text": "...", "output": "/path.wav", "speed": 0.95, "pitch": 1.0, "volume": 0.9, ...}
+            → {"id": 1, "output": "/path.wav"} 或 {"id": 1, "error": "..."}
+      健康检查：{"id": 2, "ping": true} → {"id": 2, "pong": true}
+    空闲超过SOVITS_HEALTH_CHECK_INTERVAL秒后先做健康检查，无响应自动重启；
+    从未成功启动过（infer.py不支持--serve）则标记为不可用，调用方回退到一次性模式
+    """
+    def __init__(self, sovits_root, voice_id, language):
+        infer_script = os.path.join(sovits_root, "infer.py")
+        self.worker = InferenceWorker(
+            ["python3", infer_script, "--serve", "--voice_id", str(voice_id), "--language", language],
+            cwd=sovits_root
+        )
+        self.available = True
+        self.restart_count = 0
+        self._last_ok = 0.0              # 上次成功响应的时间
+        self._lock = threading.Lock()    # 单个语音模型，同一时间只处理一个合成任务
+
+    def _ping(self):
+        """发送一次健康检查帧，成功返回True"""
+        # 新启动的进程需要先加载语音模型，按合成超时等待
+        timeout = SOVITS_PING_TIMEOUT if self.worker.is_alive() else SOVITS_REQUEST_TIMEOUT
+        try:
+            self.worker.request({"ping": True}, timeout=timeout)
+            self._last_ok = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def _mark_failed(self, error):
+        """进程出错：从未正常工作过则不再使用常驻模式，否则关闭等待重启"""
+        self.worker.stop()
+        if self.worker.served_count == 0:
+            self.available = False
+            print(f"⚠️ GPT-SoVITS常驻合成进程不可用：{error} → 回退到一次性合成模式")
+        else:
+            print(f"⚠️ GPT-SoVITS常驻合成进程异常：{error} → 下次合成自动重启")
+
+    def health_check(self):
+        """健康检查：进程未启动则启动（加载模型），无响应则重启一次，返回是否可用"""
+        with self._lock:
+            return self._health_check()
+
+    def _health_check(self):
+        if not self.available:
+            return False
+        if self._ping():
+            return True
+        # 无响应：重启后再检查一次
+        restarted = self.worker.served_count > 0
+        self.worker.stop()
+        if restarted:
+            self.restart_count += 1
+            print(f"ℹ️ GPT-SoVITS合成进程无响应，已自动重启（第{self.restart_count}次）")
+        if self._ping():
+            return True
+        self._mark_failed("健康检查无响应")
+        return False
+
+    def prewarm(self):
+        """后台启动进程并加载语音模型（第一次合成不再等待模型加载）"""
+        threading.Thread(target=self.health_check, name="sovits-prewarm", daemon=True).start()
+
+    def synthesize(self, text, voice_file, **params):
+        """常驻进程合成语音，成功返回True；失败返回False（调用方改用一次性模式）"""
+        with self._lock:
+            if not self.available:
+                return False
+            if time.monotonic() - self._last_ok > SOVITS_HEALTH_CHECK_INTERVAL and not self._health_check():
+                return False
+            try:
+                self.worker.request(dict(params, text=text, output=voice_file), timeout=SOVITS_REQUEST_TIMEOUT)
+                self._last_ok = time.monotonic()
+                return True
+            except Exception as e:
+                if self.worker.is_alive():
+                    # 进程正常，只是本次合成返回了错误
+                    print(f"⚠️ GPT-SoVITS常驻进程合成失败：{e} → 本句改用一次性模式")
+                else:
+                    self._mark_failed(e)
+                return False
+
+    def stop(self):
+        """关闭常驻合成进程"""
+        with self._lock:
+            self.worker.stop()
\ No newline at end of file
@@ -1,26 +1,49 @@
 # /root/ai_character/voice/speak_finish.py
-from memory.memory_manager import MemoryManager
+from memory.memory_manager import get_memory_manager
 from .gpt_sovits_tts import GPTSoVITS_TTS
+from .tts_pipeline import StreamingTTS
+from .playback_manager import get_playback_manager
+from config import TTS_SENTENCE_STREAMING, VOICE_PLAYBACK_ASYNC
 
 class SpeakFinish:
     """语音回复模块：锚点记忆驱动"""
-    def __init__(self):
-        self.memory_manager = MemoryManager()
+    def __init__(self, character_id="furenna"):
+        self.character_id = character_id
+        self.memory_manager = get_memory_manager(character_id)
         self.tts = GPTSoVITS_TTS()
+        self.streaming_tts = StreamingTTS(self.tts)
+        # 后台播放队列（不阻塞终端输入）；关闭时同步播放
+        self.playback = get_playback_manager() if VOICE_PLAYBACK_ASYNC else None
 
-    def process_voice_response(self, user_input):
-        """处理语音回复（锚点记忆+生成语音）"""
-        # 1. 角色生成文本回复
-        from character.character import Character
-        character = Character()
-        text_response = character.get_response(user_input)
-        # 2. 生成语音
-        voice_file = self.tts.generate_voice(text_response)
-        # 3. 播放语音（可选）
-        if voice_file:
-            self.tts.play_voice(voice_file)
+    def stop_speaking(self):
+        """打断正在播放/排队的语音（旅行者发来新消息时调用）"""
+        if self.playback is not None:
+            self.playback.cancel_all()
+
+    def process_voice_response(self, user_input, text_response=None, input_anchors=None):
+        """处理语音回复（锚点记忆+生成语音；已有文本回复/输入锚点词时直接复用）"""
+        # 1. 角色生成文本回复（未传入回复时才重新生成）
+        if text_response is None:
+            from character.character import get_character
+            text_response = get_character(self.character_id).get_response(user_input)
+        # 2. 生成语音+播放：分句模式下边合成边播放，否则整段合成后播放
+        if TTS_SENTENCE_STREAMING:
+            voice_chunks = self.streaming_tts.speak(text_response, player=self.playback)
+            voice_file = voice_chunks[0] if voice_chunks else None
+        else:
+            voice_file = self.tts.generate_voice(text_response)
+            voice_chunks = [voice_file] if voice_file else []
+            # 3. 播放语音（可选）
+            if voice_file and self.playback is not None:
+                self.playback.enqueue(voice_file, on_finish=self.tts.release_voice)
+            elif voice_file:
+                self.tts.play_voice(voice_file)
+                self.tts.release_voice(voice_file)
+        if input_anchors is None:
+            input_anchors = self.memory_manager.retrieve_all_related_memory(user_input)["input_anchors"]
         return {
             "text_response": text_response,
             "voice_file": voice_file,
-            "input_anchors": self.memory_manager.retrieve_all_related_memory(user_input)["input_anchors"]
+            "voice_chunks": voice_chunks,
+            "input_anchors": input_anchors
         }
\ No newline at end of file
@@ -0,0 +1,169 @@
+# /root/ai_character/voice/tts_cache.py
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from config import VOICE_OUTPUT_PATH, TTS_CACHE_ENABLED, TTS_CACHE_MAX_BYTES
+
+class TTSCache:
+    """
+    语音合成结果缓存：按hash(文本, 模型ID, 语速, 音调, 音量, 语言)存放wav文件
+    LRU索引持久化到index.json，总大小超过上限时淘汰最久未用的文件（合成的语音文件不再无限增长）
+    命中只在内存中调整LRU顺序，索引在写入新文件/淘汰时及退出时保存
+    get/put交出的文件会被固定（引用计数），播放完或被打断跳过后release才可能被淘汰，不会删掉排队待播放的片段
+    """
+    def __init__(self, cache_dir=None, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir if cache_dir else os.path.join(VOICE_OUTPUT_PATH, "cache")
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self._index = OrderedDict()   # {key: 文件大小}，越靠后越新
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._dirty = False           # 内存中的LRU顺序是否有未保存的变化
+        self._pinned = {}             # {key: 引用数}，已交给播放、尚未release的文件不淘汰
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(text, voice_id, speed, pitch, volume, language):
+        return hashlib.sha256(
+            json.dumps([text, voice_id, speed, pitch, volume, language], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_index(self):
+        """加载LRU索引；索引缺失/损坏时按文件修改时间扫描目录重建"""
+        entries = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 语音缓存索引损坏：{e} → 扫描目录重建")
+        if entries is None:
+            wav_files = [name for name in os.listdir(self.cache_dir) if name.endswith(".wav")]
+            wav_files.sort(key=lambda name: os.path.getmtime(os.path.join(self.cache_dir, name)))
+            entries = [[name[:-len(".wav")], 0] for name in wav_files]
+        for key, _ in entries:
+            path = self._path(key)
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                self._index[key] = size
+                self._total_bytes += size
+        self._evict()
+
+    def _save_index(self):
+        """原子写入索引（需持有self._lock）"""
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[key, size] for key, size in self._index.items()], f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def flush(self):
+        """保存命中后调整过的LRU顺序（退出时自动调用）"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _evict(self):
+        """
+        超过总大小上限时淘汰最久未用的文件，跳过被固定的文件（需持有self._lock或在初始化中调用）
+        返回是否淘汰了文件
+        """
+        evicted = False
+        while self._total_bytes > self.max_bytes:
+            key = next((key for key in self._index if key not in self._pinned), None)
+            if key is None:
+                break  # 剩下的都在使用中，release后再淘汰
+            self._total_bytes -= self._index.pop(key)
+            self.stats["evictions"] += 1
+            evicted = True
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        return evicted
+
+    def _pin(self, key):
+        self._pinned[key] = self._pinned.get(key, 0) + 1
+
+    def get(self, key):
+        """查缓存：命中返回wav路径（固定该文件，用完后调用release），未命中返回None"""
+        with self._lock:
+            path = self._path(key)
+            if key not in self._index or not os.path.exists(path):
+                if key in self._index:
+                    self._total_bytes -= self._index.pop(key)
+                    self._dirty = True
+                self.stats["misses"] += 1
+                return None
+            # 只调整内存中的LRU顺序，不写索引文件
+            self._index.move_to_end(key)
+            self._dirty = True
+            self._pin(key)
+            self.stats["hits"] += 1
+            return path
+
+    def put(self, key, voice_file):
+        """把新合成的语音文件移入缓存，返回缓存中的路径（固定该文件，用完后调用release）"""
+        with self._lock:
+            path = self._path(key)
+            os.replace(voice_file, path)
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            size = os.path.getsize(path)
+            self._index[key] = size
+            self._total_bytes += size
+            # 刚写入的文件已固定（单个文件超过上限时也保留，供本次播放）
+            self._pin(key)
+            self._evict()
+            self._save_index()
+            return path
+
+    def release(self, path):
+        """解除get/put对文件的固定（播放完或被打断跳过后调用），之前因固定而超出的部分此时淘汰"""
+        key = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            count = self._pinned.get(key)
+            if count is None:
+                return  # 不是缓存交出的文件
+            if count > 1:
+                self._pinned[key] = count - 1
+                return
+            del self._pinned[key]
+            if self._evict():
+                self._save_index()
+
+    def total_bytes(self):
+        return self._total_bytes
+
+    def hit_rate(self):
+        """命中率（命中 / 总查询）"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+_tts_cache = None
+_tts_cache_failed = False
+_tts_cache_lock = threading.Lock()
+
+def get_tts_cache():
+    """获取全局语音缓存（未启用或初始化失败时返回None）"""
+    global _tts_cache, _tts_cache_failed
+    if not TTS_CACHE_ENABLED or _tts_cache_failed:
+        return None
+    with _tts_cache_lock:
+        if _tts_cache is None:
+            try:
+                _tts_cache = TTSCache()
+            except Exception as e:
+                print(f"⚠️ 语音缓存初始化失败：{e} → 不使用缓存")
+                _tts_cache_failed = True
+                return None
+        return _tts_cache
\ No newline at end of file
@@ -0,0 +1,83 @@
+# /root/ai_character/voice/tts_pipeline.py
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from .gpt_sovits_tts import GPTSoVITS_TTS
+
+# 分句标点（句尾标点保留在句子末尾，连续标点归入同一句）
+SENTENCE_SPLIT_PATTERN = re.compile(r"[^。！？~～]*[。！？~～]+|[^。！？~～]+$")
+
+def split_sentences(text):
+    """按。！？~分句，去掉空白句"""
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_PATTERN.findall(text or "") if sentence.strip()]
+
+class StreamingTTS:
+    """
+    分句流式语音合成：生产者线程逐句合成，已合成的片段放入队列
+    播放端从队列取片段边合成边播放，首段语音的等待时间只取决于第一句的合成
+    """
+    _DONE = object()  # 队列结束标记
+
+    def __init__(self, tts=None):
+        self.tts = tts if tts is not None else GPTSoVITS_TTS()
+
+    def _chunk_file(self, batch_id, index):
+        return os.path.join(self.tts.output_dir, f"furenna_retired_{batch_id}_{index:03d}.wav")
+
+    def _produce(self, sentences, batch_id, chunk_queue):
+        """生产者：按顺序逐句合成，合成失败的句子跳过"""
+        try:
+            for index, sentence in enumerate(sentences):
+                voice_file = self.tts.generate_voice(sentence, voice_file=self._chunk_file(batch_id, index))
+                if voice_file:
+                    chunk_queue.put(voice_file)
+        finally:
+            chunk_queue.put(self._DONE)
+
+    def iter_voice_chunks(self, text):
+        """
+        按句合成（生成器）：每合成完一句就产出该句的语音文件，顺序与原文一致
+        产出的文件在语音缓存中被固定，用完后调用self.tts.release_voice
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return
+        batch_id = f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
+        chunk_queue = queue.Queue()
+        producer = threading.Thread(
+            target=self._produce, args=(sentences, batch_id, chunk_queue), name="tts-producer", daemon=True
+        )
+        producer.start()
+        while True:
+            voice_file = chunk_queue.get()
+            if voice_file is self._DONE:
+                break
+            yield voice_file
+
+    def synthesize_chunks(self, text):
+        """合成全部句子，返回片段语音文件列表（不播放，不固定在缓存中）"""
+        voice_chunks = list(self.iter_voice_chunks(text))
+        for voice_file in voice_chunks:
+            self.tts.release_voice(voice_file)
+        return voice_chunks
+
+    def speak(self, text, play=True, player=None):
+        """
+        合成并播放：后面的句子在播放前一句时继续合成，返回片段语音文件列表
+        传入player（PlaybackManager）时片段合成完即加入后台播放队列，不等待播放
+        """
+        voice_chunks = []
+        for voice_file in self.iter_voice_chunks(text):
+            voice_chunks.append(voice_file)
+            if not play:
+                self.tts.release_voice(voice_file)
+            elif player is not None:
+                # 播放完/被打断跳过后才解除缓存固定，排队中的片段不会被淘汰
+                player.enqueue(voice_file, on_finish=self.tts.release_voice)
+            else:
+                self.tts.play_voice(voice_file)
+                self.tts.release_voice(voice_file)
+        return voice_chunks
\ No newline at end of file